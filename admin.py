@@ -2,10 +2,20 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime
+from collections import Counter
 import os
-from db import get_all_challans, update_challan_status, get_challan_stats
+from db import (fetch_challans_arrow, query_challans, count_challans, bulk_update_challan_status, get_challan_stats,
+                get_monthly_series, CHALLAN_COLUMNS)
 from auth import logout, get_current_user
-from utils import export_to_csv
+from exporter import export_challans, EXPORT_FORMATS
+from importer import import_challans, errors_to_csv, REQUIRED_COLUMNS, OPTIONAL_COLUMNS
+from reconcile import reconcile_statement, entries_to_csv, REPORT_FIELDS
+from notifications import notify_status_change, get_outbox_counts
+from receipts import get_preview
+from presentation import challan_frame
+from query_cache import get_cache_stats
+from metrics import timed, snapshot, slow_queries, prometheus_text, reset as reset_metrics, SLOW_QUERY_MS
+from render_service import get_render_service
 
 def admin_view():
     """Admin interface"""
@@ -25,9 +35,31 @@ def admin_view():
         st.metric("Pending", stats.get('pending', 0))
         st.metric("Approved", stats.get('approved', 0))
         st.metric("Rejected", stats.get('rejected', 0))
+        
+        cache_stats = get_cache_stats()
+        st.caption(
+            f"Query cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses "
+            f"({cache_stats['hit_rate']:.0%})"
+        )
+        render_stats = get_render_service().metrics()
+        st.caption(
+            f"PDF renders: {render_stats['queue_depth']} queued, {render_stats['running']} running, "
+            f"p95 {render_stats['latency_p95_ms']:.0f} ms"
+        )
+        outbox = get_outbox_counts()
+        st.caption(
+            f"Emails: {outbox.get('queued', 0) + outbox.get('sending', 0)} waiting, "
+            f"{outbox.get('sent', 0)} sent, {outbox.get('failed', 0)} failed"
+        )
+    
+    # Hidden page, reached with ?view=metrics
+    if st.query_params.get("view") == "metrics":
+        metrics_page()
+        return
     
     # Main content tabs
-    tab1, tab2, tab3 = st.tabs(["📊 Dashboard", "📋 Manage Challans", "📈 Reports"])
+    tab1, tab2, tab3, tab4, tab5 = st.tabs(["📊 Dashboard", "📋 Manage Challans", "📈 Reports", "📥 Import",
+                                            "🏦 Reconcile"])
     
     with tab1:
         dashboard_overview()
@@ -37,7 +69,14 @@ def admin_view():
     
     with tab3:
         reports_section()
+    
+    with tab4:
+        import_section()
+    
+    with tab5:
+        reconcile_section()
 
+@timed()
 def dashboard_overview():
     """Dashboard overview"""
     st.markdown("#### Dashboard Overview")
@@ -57,21 +96,21 @@ def dashboard_overview():
     
     # Recent challans
     st.markdown("#### Recent Challans")
-    challans = get_all_challans(limit=10)
+    # Columnar fetch of just the displayed columns
+    challans = fetch_challans_arrow(['id', 'student_name', 'roll_number', 'amount', 'status', 'created_date'], limit=10)
     
-    if challans:
-        df = pd.DataFrame(challans)
-        df['created_date'] = pd.to_datetime(df['created_date']).dt.strftime('%Y-%m-%d %H:%M')
-        df['amount'] = df['amount'].apply(lambda x: f"Rs. {x:,}")
+    if challans.num_rows:
+        df = challan_frame(challans)
         
         st.dataframe(
-            df[['id', 'student_name', 'roll_number', 'amount', 'status', 'created_date']],
+            df,
             use_container_width=True,
             hide_index=True
         )
     else:
         st.info("No challans found.")
 
+@timed()
 def manage_challans():
     """Manage all challans"""
     st.markdown("#### Manage Challans")
@@ -90,56 +129,182 @@ def manage_challans():
     with col4:
         search_roll = st.text_input("Search by Roll Number")
     
-    # Get filtered challans
-    challans = get_all_challans()
+    # Filtering and pagination run in SQL; reset to the first page whenever
+    # the filters change
+    filters = {
+        'status': None if status_filter == "All" else status_filter,
+        'semester': None if semester_filter == "All" else semester_filter,
+        'name': search_name.strip() or None,
+        'roll_number': search_roll.strip() or None
+    }
+    if st.session_state.get('challan_filters') != filters:
+        st.session_state.challan_filters = filters
+        st.session_state.challan_page_cursors = [None]
+    cursors = st.session_state.challan_page_cursors
+    
+    result = st.session_state.pop('challan_action_result', None)
+    if result:
+        st.success(result)
+    error = st.session_state.pop('challan_action_error', None)
+    if error:
+        st.error(error)
+    
+    page = query_challans(**filters, after=cursors[-1])
+    challans = page['rows']
     
     if challans:
-        df = pd.DataFrame(challans)
-        
-        # Apply filters
-        if status_filter != "All":
-            df = df[df['status'] == status_filter]
-        if semester_filter != "All":
-            df = df[df['semester'] == semester_filter]
-        if search_name:
-            df = df[df['student_name'].str.contains(search_name, case=False, na=False)]
-        if search_roll:
-            df = df[df['roll_number'].str.contains(search_roll, case=False, na=False)]
-        
-        # Format display
-        df['created_date'] = pd.to_datetime(df['created_date']).dt.strftime('%Y-%m-%d %H:%M')
-        df['amount'] = df['amount'].apply(lambda x: f"Rs. {x:,}")
+        df = challan_frame(
+            challans, ['id', 'challan_number', 'student_name', 'roll_number', 'semester', 'amount', 'reason', 'status',
+                       'created_date']
+        )
         
         # Display table
         st.dataframe(
-            df[['id', 'student_name', 'roll_number', 'semester', 'amount', 'reason', 'status', 'created_date']],
+            df,
             use_container_width=True,
             hide_index=True
         )
         
+        # Pagination
+        col1, col2, col3 = st.columns([1, 2, 1])
+        with col1:
+            if st.button("◀ Previous", disabled=len(cursors) == 1):
+                cursors.pop()
+                st.rerun()
+        with col2:
+            st.caption(f"Page {len(cursors)}")
+        with col3:
+            if st.button("Next ▶", disabled=page['next_cursor'] is None):
+                cursors.append(page['next_cursor'])
+                st.rerun()
+        
+        receipt_review(challans)
+        
         # Action section
         st.markdown("#### Challan Actions")
         
-        if not df.empty:
-            selected_id = st.selectbox("Select Challan ID:", df['id'].tolist())
-            
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                if st.button("✅ Approve"):
-                    if update_challan_status(selected_id, 'approved'):
-                        st.success("Challan approved!")
-                        st.rerun()
-            
-            with col2:
-                if st.button("❌ Reject"):
-                    if update_challan_status(selected_id, 'rejected'):
-                        st.success("Challan rejected!")
-                        st.rerun()
+        apply_to_all = st.checkbox("Apply to every challan matching the filters (all pages)")
+        selected_ids = []
+        if not apply_to_all:
+            selected_ids = st.multiselect("Select Challan IDs:", df['id'].tolist())
+        comments = st.text_input("Admin Comments (optional)")
+        
+        col1, col2 = st.columns(2)
+        action = None
+        
+        with col1:
+            if st.button("✅ Approve"):
+                action = 'approved'
         
+        with col2:
+            if st.button("❌ Reject"):
+                action = 'rejected'
+        
+        if action and apply_to_all:
+            # Filter-wide changes wait for an explicit confirmation below
+            st.session_state.challan_pending_action = {'action': action, 'comments': comments, 'filters': filters}
+        elif action and selected_ids:
+            apply_challan_action(action, comments, challan_ids=selected_ids)
+        elif action:
+            st.warning("Select at least one challan.")
+        
+        pending = st.session_state.get('challan_pending_action')
+        if pending and (not apply_to_all or pending['filters'] != filters):
+            # The filters the count was shown for no longer apply
+            st.session_state.pop('challan_pending_action')
+        elif pending:
+            confirm_filter_action(pending)
+        
+    elif len(cursors) > 1:
+        # The page emptied out (e.g. its rows were just approved); start over
+        st.session_state.challan_page_cursors = [None]
+        st.rerun()
     else:
         st.info("No challans found.")
 
+def apply_challan_action(action: str, comments: str, challan_ids: list = None, filters: dict = None):
+    """Run a bulk status change, queue the student emails and report the outcome on the next rerun"""
+    try:
+        outcomes = bulk_update_challan_status(action, comments, challan_ids=challan_ids, filters=filters)
+    except Exception as e:
+        st.session_state.challan_action_error = f"Could not update the challans: {e}"
+        st.rerun()
+    updated = [challan_id for challan_id, outcome in outcomes.items() if outcome == 'updated']
+    # Only queued here; the dispatcher thread sends them
+    notify_status_change(updated, action, comments)
+    if 'error' in outcomes.values():
+        st.session_state.challan_action_error = summarize_outcomes(action, outcomes)
+    else:
+        st.session_state.challan_action_result = summarize_outcomes(action, outcomes)
+    st.rerun()
+
+def confirm_filter_action(pending: dict):
+    """Ask before changing every challan matching the filters, showing how many that is"""
+    verb = "approve" if pending['action'] == 'approved' else "reject"
+    matching = count_challans(**pending['filters'])
+    no_filters = not any(pending['filters'].values())
+    if no_filters:
+        st.warning(f"No filters are set: this will {verb} every challan in the database ({matching:,}).")
+    else:
+        st.warning(f"This will {verb} all {matching:,} challan(s) matching the filters.")
+    # With no filters a second, explicit acknowledgement is required
+    acknowledged = not no_filters or st.checkbox(f"Yes, {verb} every challan")
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button(f"Confirm: {verb} {matching:,} challan(s)", disabled=not matching or not acknowledged):
+            st.session_state.pop('challan_pending_action')
+            apply_challan_action(pending['action'], pending['comments'], filters=pending['filters'])
+    with col2:
+        if st.button("Cancel"):
+            st.session_state.pop('challan_pending_action')
+            st.rerun()
+
+RECEIPT_GRID_COLUMNS = 4
+
+def receipt_review(challans: list):
+    """Receipt thumbnails for the current page, with full size on demand"""
+    with_receipts = [c for c in challans if c.get('receipt_path')]
+    # Nothing is loaded until asked for; then only small thumbnails
+    if not with_receipts or not st.toggle(f"🧾 Show receipts ({len(with_receipts)} on this page)"):
+        return
+    
+    columns = st.columns(RECEIPT_GRID_COLUMNS)
+    for i, challan in enumerate(with_receipts):
+        with columns[i % RECEIPT_GRID_COLUMNS]:
+            thumbnail = get_preview(challan['receipt_path'], challan.get('receipt_hash'))
+            label = f"#{challan['id']} {challan['student_name']}"
+            if thumbnail:
+                st.image(thumbnail, caption=label)
+            else:
+                st.caption(f"{label} (no preview yet)")
+            if st.button("🔍 Full size", key=f"receipt_view_{challan['id']}"):
+                st.session_state.receipt_view_id = challan['id']
+    
+    viewing = next((c for c in with_receipts if c['id'] == st.session_state.get('receipt_view_id')), None)
+    if viewing:
+        st.markdown(f"##### Receipt for challan #{viewing['id']}")
+        review = get_preview(viewing['receipt_path'], viewing.get('receipt_hash'), 'review')
+        if review:
+            st.image(review, use_container_width=True)
+        if os.path.exists(viewing['receipt_path']):
+            with open(viewing['receipt_path'], "rb") as f:
+                st.download_button("⬇️ Download original", data=f.read(),
+                                   file_name=os.path.basename(viewing['receipt_path']))
+
+def summarize_outcomes(action: str, outcomes: dict) -> str:
+    """Describe the per-challan results of a bulk status update"""
+    counts = Counter(outcomes.values())
+    parts = [f"{action.capitalize()} {counts.get('updated', 0)} challan(s)"]
+    if counts.get('unchanged'):
+        parts.append(f"{counts['unchanged']} already {action}")
+    if counts.get('not_found'):
+        parts.append(f"{counts['not_found']} not found")
+    if counts.get('error'):
+        parts.append(f"{counts['error']} failed")
+    return "; ".join(parts) + "."
+
+@timed()
 def reports_section():
     """Reports and exports"""
     st.markdown("#### Reports & Export")
@@ -148,19 +313,36 @@ def reports_section():
     col1, col2 = st.columns(2)
     
     with col1:
-        if st.button("📊 Export All Challans (CSV)"):
-            challans = get_all_challans()
-            if challans:
-                csv_data = export_to_csv(challans)
-                st.download_button(
-                    label="📥 Download CSV",
-                    data=csv_data,
-                    file_name=f"challans_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                    mime="text/csv",
-                    use_container_width=True
-                )
-            else:
-                st.error("No data to export.")
+        export_format = st.selectbox("Export Format", list(EXPORT_FORMATS), format_func=str.upper)
+        export_columns = st.multiselect("Columns", list(CHALLAN_COLUMNS), default=list(CHALLAN_COLUMNS))
+        use_filters = st.checkbox("Only challans matching the Manage Challans filters")
+        
+        if st.button("📊 Export Challans"):
+            filters = st.session_state.get('challan_filters') if use_filters else None
+            # The export streams to a temp file; its bytes are read once and
+            # kept for the download button, and the file is removed at once
+            path = export_challans(export_format, export_columns or None, filters)
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            finally:
+                os.remove(path)
+            st.session_state.export_file = {
+                'data': data,
+                'format': export_format,
+                'name': f"challans_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+            }
+        
+        export_file = st.session_state.get('export_file')
+        if export_file:
+            mime, extension = EXPORT_FORMATS[export_file['format']]
+            st.download_button(
+                label=f"📥 Download {export_file['format'].upper()}",
+                data=export_file['data'],
+                file_name=export_file['name'] + extension,
+                mime=mime,
+                use_container_width=True
+            )
     
     with col2:
         if st.button("📈 Generate Summary Report"):
@@ -184,18 +366,131 @@ def reports_section():
     
     # Monthly report
     st.markdown("#### Monthly Analysis")
-    challans = get_all_challans()
+    breakdown = st.selectbox("Break down by", ["None", "Status", "Semester"])
+    series = get_monthly_series(by_status=breakdown == "Status", by_semester=breakdown == "Semester")
     
-    if challans:
-        df = pd.DataFrame(challans)
-        df['created_date'] = pd.to_datetime(df['created_date'])
-        df['month'] = df['created_date'].dt.to_period('M')
+    if series:
+        df = pd.DataFrame(series)
         
-        monthly_stats = df.groupby('month').agg({
-            'id': 'count',
-            'amount': 'sum'
-        }).rename(columns={'id': 'Total Challans', 'amount': 'Total Amount'})
-        
-        if not monthly_stats.empty:
+        if breakdown == "None":
+            monthly_stats = df.set_index('month').rename(
+                columns={'count': 'Total Challans', 'amount': 'Total Amount'})
             st.bar_chart(monthly_stats['Total Challans'])
             st.line_chart(monthly_stats['Total Amount'])
+        else:
+            column = breakdown.lower()
+            st.bar_chart(df.pivot_table(index='month', columns=column, values='count', fill_value=0))
+            st.line_chart(df.pivot_table(index='month', columns=column, values='amount', fill_value=0))
+
+def import_section():
+    """Bulk challan import from CSV/XLSX"""
+    st.markdown("#### Bulk Import Challans")
+    st.caption(
+        f"Required columns: {', '.join(REQUIRED_COLUMNS)}. "
+        f"Optional: {', '.join(OPTIONAL_COLUMNS)} (defaults: now, 3 days later, pending)."
+    )
+    
+    uploaded_file = st.file_uploader("Choose a CSV or Excel file", type=['csv', 'xlsx'])
+    all_or_nothing = st.checkbox("Cancel the whole import if any row is invalid")
+    
+    if uploaded_file and st.button("📥 Import Challans"):
+        fmt = uploaded_file.name.rsplit('.', 1)[-1].lower()
+        with st.spinner("Importing..."):
+            report = import_challans(uploaded_file, fmt, skip_invalid=not all_or_nothing)
+        
+        if report['imported']:
+            st.success(f"Imported {report['imported']:,} of {report['total']:,} rows.")
+        else:
+            st.warning(f"No rows imported ({report['total']:,} read).")
+        
+        if report['errors']:
+            st.error(f"{report['failed']:,} row(s) failed validation.")
+            errors_df = pd.DataFrame(
+                [{'Row': e['row'], 'Errors': "; ".join(e['errors'])} for e in report['errors'][:1000]]
+            )
+            st.dataframe(errors_df, use_container_width=True, hide_index=True)
+            st.download_button(
+                label="📥 Download Error Report",
+                data=errors_to_csv(report),
+                file_name=f"import_errors_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+                mime="text/csv"
+            )
+
+def reconcile_section():
+    """Match a bank statement against challans and approve the payments found"""
+    st.markdown("#### Reconcile Bank Statement")
+    st.caption(
+        "CSV with an amount (or credit) column and a challan number, roll number or narration column. "
+        "Challans matched by number, or by roll number and amount, are approved together."
+    )
+    
+    uploaded_file = st.file_uploader("Choose a statement CSV", type=['csv'], key="statement_upload")
+    dry_run = st.checkbox("Dry run (report matches without approving)")
+    
+    if uploaded_file and st.button("🏦 Reconcile"):
+        with st.spinner("Reconciling..."):
+            report = reconcile_statement(uploaded_file, apply=not dry_run,
+                                         comments=f"Reconciled with bank statement {uploaded_file.name}")
+        
+        if report['errors']:
+            st.error(f"Reconciliation failed: {'; '.join(report['errors'])}")
+            return
+        
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Matched", f"{len(report['matched']):,}")
+        col2.metric("Unmatched", f"{len(report['unmatched']):,}")
+        col3.metric("Ambiguous", f"{len(report['ambiguous']):,}")
+        if dry_run:
+            st.info(f"Dry run: {len(report['matched']):,} challan(s) would be approved.")
+        else:
+            st.success(f"Approved {report['updated']:,} challan(s) from {report['total']:,} statement lines.")
+        
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        for kind in ('matched', 'unmatched', 'ambiguous'):
+            entries = report[kind]
+            if not entries:
+                continue
+            with st.expander(f"{kind.title()} ({len(entries):,})"):
+                st.dataframe(pd.DataFrame(entries[:1000], columns=REPORT_FIELDS),
+                             use_container_width=True, hide_index=True)
+                st.download_button(
+                    label=f"📥 Download {kind} report",
+                    data=entries_to_csv(entries),
+                    file_name=f"reconciliation_{kind}_{stamp}.csv",
+                    mime="text/csv",
+                    key=f"reconcile_{kind}"
+                )
+
+def metrics_page():
+    """Per-function timings, slow SQL and Prometheus text for this server process"""
+    st.markdown("#### Metrics")
+    st.caption("Counters cover this server process since it started (or since the last reset).")
+    
+    rows = snapshot()
+    if rows:
+        df = pd.DataFrame(rows)
+        for column in ('total_ms', 'mean_ms', 'p50_ms', 'p95_ms', 'max_ms'):
+            df[column] = df[column].round(2)
+        st.dataframe(df, use_container_width=True, hide_index=True)
+    else:
+        st.info("Nothing recorded yet (metrics may be disabled with CHALLAN_METRICS=0).")
+    
+    st.markdown(f"#### Slow Queries (over {SLOW_QUERY_MS:g} ms)")
+    slow = slow_queries()
+    if slow:
+        st.dataframe(pd.DataFrame(slow), use_container_width=True, hide_index=True)
+    else:
+        st.info("No slow queries recorded.")
+    
+    st.markdown("#### Background Services")
+    st.json({'query_cache': get_cache_stats(), 'pdf_renders': get_render_service().metrics(),
+             'email_outbox': get_outbox_counts()})
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button("📥 Prometheus text", prometheus_text(), file_name="challan_metrics.prom",
+                           mime="text/plain")
+    with col2:
+        if st.button("Reset metrics"):
+            reset_metrics()
+            st.rerun()
@@ -0,0 +1,261 @@
+"""JSON API over the challan operations for scripts and portal integrations.
+
+    CHALLAN_API_TOKENS=secret1,secret2 python api.py [--port 8502] [--processes 1]
+
+Every request needs an "Authorization: Bearer <token>" header with one of
+the configured tokens.
+"""
+import argparse
+import asyncio
+import base64
+import functools
+import hmac
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Optional
+
+import tornado.httpserver
+import tornado.netutil
+import tornado.process
+import tornado.web
+
+from db import (get_challan, get_challan_by_number, get_challan_stats, get_student_challans, query_challans,
+                bulk_update_challan_status, insert_challan, init_database, CHALLAN_PAGE_SIZE, POOL_SIZE)
+from importer import validate_import_row
+from metrics import observe, prometheus_text, start_metrics_writer
+from notifications import get_email_dispatcher, notify_status_change
+from pdf_store import content_key, get_cached_pdf
+from render_service import get_render_service, RenderQueueFull
+from utils import CHALLAN_STATUSES
+
+API_PORT = int(os.environ.get("CHALLAN_API_PORT", "8502"))
+API_TOKENS = tuple(token.strip() for token in os.environ.get("CHALLAN_API_TOKENS", "").split(",") if token.strip())
+API_MAX_PAGE_SIZE = 500
+# Keep-alive connections idle for longer than this are closed
+API_IDLE_TIMEOUT = 75.0
+# Longest a request waits for a PDF that is not cached yet
+API_PDF_TIMEOUT = 30.0
+
+# Database calls run on these threads, never on the event loop: a write
+# waiting out busy_timeout behind an import must not stall other requests.
+# One thread per pooled connection, so calls queue here rather than in the pool.
+_db_executor = ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix="api-db")
+
+def encode_cursor(cursor: Optional[tuple]) -> Optional[str]:
+    """Turn a query_challans next_cursor into an opaque URL-safe token"""
+    if cursor is None:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode().rstrip("=")
+
+def decode_cursor(token: str) -> tuple:
+    """Reverse encode_cursor; raises ValueError for malformed tokens"""
+    try:
+        created_date, challan_id = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except Exception:
+        raise ValueError("Invalid page cursor")
+    return str(created_date), int(challan_id)
+
+class BaseHandler(tornado.web.RequestHandler):
+    """Bearer-token authentication and JSON errors.
+
+    Responses to GET get an ETag and If-None-Match is answered with 304
+    (tornado's default behaviour, kept for every handler).
+    """
+
+    def prepare(self):
+        header = self.request.headers.get("Authorization", "")
+        token = header[7:] if header.startswith("Bearer ") else ""
+        # Constant-time comparison against every configured token
+        if not any(hmac.compare_digest(token.encode(), known.encode()) for known in API_TOKENS):
+            self.set_header("WWW-Authenticate", "Bearer")
+            raise tornado.web.HTTPError(401, reason="Missing or invalid API token")
+
+    def write_json(self, data, status: int = 200):
+        self.set_status(status)
+        self.set_header("Content-Type", "application/json; charset=utf-8")
+        self.finish(json.dumps(data, separators=(",", ":"), default=str))
+
+    def json_body(self) -> Dict:
+        try:
+            body = json.loads(self.request.body or b"{}")
+        except ValueError:
+            raise tornado.web.HTTPError(400, reason="Request body must be JSON")
+        if not isinstance(body, dict):
+            raise tornado.web.HTTPError(400, reason="Request body must be a JSON object")
+        return body
+
+    def write_error(self, status_code: int, **kwargs):
+        self.set_header("Content-Type", "application/json; charset=utf-8")
+        self.finish(json.dumps({'error': self._reason}))
+
+    async def run_db(self, fn, *args, **kwargs):
+        """Run a blocking database call on the database threads"""
+        return await asyncio.get_running_loop().run_in_executor(
+            _db_executor, functools.partial(fn, *args, **kwargs))
+
+    async def challan_or_404(self, challan_id: str) -> Dict:
+        challan = await self.run_db(get_challan, int(challan_id))
+        if challan is None:
+            raise tornado.web.HTTPError(404, reason=f"Challan {challan_id} not found")
+        return challan
+
+class ChallansHandler(BaseHandler):
+    async def get(self):
+        """Filtered list, newest first, one page at a time"""
+        try:
+            limit = min(int(self.get_query_argument("limit", str(CHALLAN_PAGE_SIZE))), API_MAX_PAGE_SIZE)
+            after = self.get_query_argument("after", None)
+            after = decode_cursor(after) if after else None
+        except ValueError as e:
+            raise tornado.web.HTTPError(400, reason=str(e) or "limit must be a number")
+        if limit < 1:
+            raise tornado.web.HTTPError(400, reason="limit must be positive")
+
+        page = await self.run_db(
+            query_challans,
+            status=self.get_query_argument("status", None),
+            semester=self.get_query_argument("semester", None),
+            name=self.get_query_argument("name", None),
+            roll_number=self.get_query_argument("roll_number", None),
+            limit=limit, after=after,
+        )
+        self.write_json({'challans': page['rows'], 'next': encode_cursor(page['next_cursor'])})
+
+    async def post(self):
+        """Create a challan; fields as in the import format"""
+        record, errors = validate_import_row(self.json_body(), datetime.now().replace(microsecond=0))
+        if errors:
+            self.write_json({'error': "Invalid challan", 'errors': errors}, 400)
+            return
+        challan_id = await self.run_db(insert_challan, record)
+        if challan_id is None:
+            raise tornado.web.HTTPError(500, reason="Could not create the challan")
+        self.set_header("Location", f"/challans/{challan_id}")
+        self.write_json(await self.run_db(get_challan, challan_id), 201)
+
+class ChallanHandler(BaseHandler):
+    async def get(self, challan_id: str):
+        self.write_json(await self.challan_or_404(challan_id))
+
+class ChallanNumberHandler(BaseHandler):
+    async def get(self, challan_number: str):
+        """Look a challan up by the number printed on it (and quoted on bank statements)"""
+        challan = await self.run_db(get_challan_by_number, challan_number)
+        if challan is None:
+            raise tornado.web.HTTPError(404, reason=f"Challan number {challan_number} not found")
+        self.write_json(challan)
+
+class StatusHandler(BaseHandler):
+    async def put(self, challan_id: str):
+        """Set a challan's status (and optional comments), emailing the student"""
+        body = self.json_body()
+        status = body.get('status')
+        comments = str(body.get('comments') or "")
+        if status not in CHALLAN_STATUSES:
+            raise tornado.web.HTTPError(400, reason=f"status must be one of: {', '.join(CHALLAN_STATUSES)}")
+
+        outcomes = await self.run_db(bulk_update_challan_status, status, comments, challan_ids=[int(challan_id)])
+        outcome = outcomes[int(challan_id)]
+        if outcome == 'not_found':
+            raise tornado.web.HTTPError(404, reason=f"Challan {challan_id} not found")
+        if outcome == 'error':
+            raise tornado.web.HTTPError(500, reason="Could not update the challan")
+        if outcome == 'updated':
+            await self.run_db(notify_status_change, [int(challan_id)], status, comments)
+        self.write_json(dict(await self.challan_or_404(challan_id), outcome=outcome))
+
+    patch = put
+
+class StudentChallansHandler(BaseHandler):
+    async def get(self, roll_number: str):
+        self.write_json({'challans': await self.run_db(get_student_challans, roll_number)})
+
+class StatsHandler(BaseHandler):
+    async def get(self):
+        self.write_json(await self.run_db(get_challan_stats))
+
+class PdfHandler(BaseHandler):
+    async def get(self, challan_id: str):
+        challan = await self.challan_or_404(challan_id)
+        # The content key changes whenever the PDF would, so the PDF is
+        # never hashed (tornado only computes an ETag when none is set)
+        etag = f'"{content_key(challan)[:32]}"'
+        self.set_header("Etag", etag)
+        self.set_header("Content-Type", "application/pdf")
+        self.set_header("Content-Disposition", f'attachment; filename="challan_{challan_id}.pdf"')
+        # Answer conditional requests before reading or rendering anything
+        if self.check_etag_header():
+            self.set_status(304)
+            self.finish()
+            return
+
+        data = get_cached_pdf(challan)
+        if data is None:
+            # Render on the process pool so the event loop keeps serving
+            service = get_render_service()
+            try:
+                job_id = service.submit(challan)
+            except RenderQueueFull:
+                self.set_header("Retry-After", "5")
+                raise tornado.web.HTTPError(503, reason="PDF renderer is busy")
+            data = await asyncio.get_running_loop().run_in_executor(
+                None, service.result, job_id, API_PDF_TIMEOUT)
+            if data is None:
+                raise tornado.web.HTTPError(503, reason="PDF rendering did not finish in time")
+        self.finish(data)
+
+class MetricsHandler(BaseHandler):
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4")
+        self.finish(prometheus_text())
+
+def make_app() -> tornado.web.Application:
+    """Build the API application"""
+    challan_id = r"(\d+)"
+    return tornado.web.Application([
+        (r"/challans", ChallansHandler),
+        (rf"/challans/{challan_id}", ChallanHandler),
+        (rf"/challans/{challan_id}/status", StatusHandler),
+        (rf"/challans/{challan_id}/pdf", PdfHandler),
+        (r"/challans/by-number/([\d -]+)", ChallanNumberHandler),
+        (r"/students/([^/]+)/challans", StudentChallansHandler),
+        (r"/stats", StatsHandler),
+        (r"/metrics", MetricsHandler),
+    ], log_function=_log_request)
+
+def _log_request(handler: tornado.web.RequestHandler):
+    # Per-route latency and status next to the function timings; tornado's
+    # per-request access log line is skipped as it costs more than most requests
+    request_time = handler.request.request_time()
+    observe(f"api.{type(handler).__name__}", request_time, error=handler.get_status() >= 500)
+
+def main():
+    parser = argparse.ArgumentParser(description="Challan JSON API")
+    parser.add_argument("--port", type=int, default=API_PORT)
+    parser.add_argument("--address", default="")
+    parser.add_argument("--processes", type=int, default=1, help="worker processes sharing the port (0 = one per CPU)")
+    args = parser.parse_args()
+
+    if not API_TOKENS:
+        raise SystemExit("Set CHALLAN_API_TOKENS to a comma-separated list of API tokens")
+
+    init_database()
+    # Bind before forking so every worker accepts on the same socket
+    sockets = tornado.netutil.bind_sockets(args.port, args.address)
+    if args.processes != 1:
+        tornado.process.fork_processes(args.processes)
+
+    async def serve():
+        get_email_dispatcher().start()
+        start_metrics_writer()
+        server = tornado.httpserver.HTTPServer(make_app(), xheaders=True, idle_connection_timeout=API_IDLE_TIMEOUT)
+        server.add_sockets(sockets)
+        await asyncio.Event().wait()
+
+    print(f"Challan API listening on port {args.port}")
+    asyncio.run(serve())
+
+if __name__ == "__main__":
+    main()
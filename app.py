@@ -1,10 +1,9 @@
 
 import streamlit as st
 import os
-from auth import initialize_session_state, login, logout, is_authenticated, is_admin
+from auth import bootstrap, initialize_session_state, login, logout, is_authenticated, is_admin, LoginThrottled
 from student import student_view
 from admin import admin_view
-from db import init_database
 
 # Page config
 st.set_page_config(
@@ -50,8 +49,8 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 def main():
-    # Initialize database and session state
-    init_database()
+    # Initialize database (once per process) and session state
+    bootstrap()
     initialize_session_state()
     
     # Header
@@ -91,11 +90,16 @@ def show_login():
         if login_btn or admin_login_btn:
             if username and password:
                 is_admin_login = admin_login_btn
-                if login(username, password, is_admin_login):
-                    st.success("Login successful!")
-                    st.rerun()
+                try:
+                    logged_in = login(username, password, is_admin_login)
+                except LoginThrottled as e:
+                    st.error(f"{e}.")
                 else:
-                    st.error("Invalid credentials. Please try again.")
+                    if logged_in:
+                        st.success("Login successful!")
+                        st.rerun()
+                    else:
+                        st.error("Invalid credentials. Please try again.")
             else:
                 st.error("Please enter both username and password.")
     
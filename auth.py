@@ -1,7 +1,84 @@
 import streamlit as st
 import bcrypt
+import os
 import sqlite3
-from db import get_connection, ensure_admin_users_table
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+from db import connection, init_database
+from metrics import start_metrics_writer, timed
+from notifications import get_email_dispatcher
+
+# Admin login attempts: each username and each client IP gets a bucket of
+# BURST attempts that refills one attempt every REFILL_SECONDS
+LOGIN_USER_BURST = int(os.environ.get("CHALLAN_LOGIN_USER_BURST", "5"))
+LOGIN_USER_REFILL_SECONDS = float(os.environ.get("CHALLAN_LOGIN_USER_REFILL_SECONDS", "60"))
+LOGIN_IP_BURST = int(os.environ.get("CHALLAN_LOGIN_IP_BURST", "20"))
+LOGIN_IP_REFILL_SECONDS = float(os.environ.get("CHALLAN_LOGIN_IP_REFILL_SECONDS", "6"))
+
+# bcrypt checks run on this many threads; at most BCRYPT_MAX_PENDING more
+# may wait, further attempts are refused rather than queued
+BCRYPT_WORKERS = int(os.environ.get("CHALLAN_BCRYPT_WORKERS", "2"))
+BCRYPT_MAX_PENDING = int(os.environ.get("CHALLAN_BCRYPT_MAX_PENDING", "8"))
+
+class LoginThrottled(Exception):
+    """Raised when a login attempt is refused by rate limiting"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Too many login attempts, try again in {retry_after:.0f} seconds")
+        self.retry_after = retry_after
+
+class TokenBucket:
+    """Per-key token buckets holding up to burst tokens, refilled one every refill_seconds"""
+
+    # Buckets kept before full (idle) ones are pruned
+    MAX_KEYS = 10000
+
+    def __init__(self, burst: int, refill_seconds: float):
+        self.burst = burst
+        self.refill_seconds = refill_seconds
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def _tokens(self, key: str, now: float) -> float:
+        tokens, updated = self._buckets.get(key, (self.burst, now))
+        return min(self.burst, tokens + (now - updated) / self.refill_seconds)
+
+    def take(self, key: str) -> float:
+        """Take a token for key; returns 0 on success, else seconds until one is available"""
+        now = time.monotonic()
+        with self._lock:
+            tokens = self._tokens(key, now)
+            if tokens < 1:
+                return (1 - tokens) * self.refill_seconds
+            self._buckets[key] = (tokens - 1, now)
+            if len(self._buckets) > self.MAX_KEYS:
+                self._prune(now)
+            return 0.0
+
+    def reset(self, key: str):
+        """Refill a key's bucket"""
+        with self._lock:
+            self._buckets.pop(key, None)
+
+    def _prune(self, now: float):
+        for key in [k for k in self._buckets if self._tokens(k, now) >= self.burst]:
+            del self._buckets[key]
+
+_user_buckets = TokenBucket(LOGIN_USER_BURST, LOGIN_USER_REFILL_SECONDS)
+_ip_buckets = TokenBucket(LOGIN_IP_BURST, LOGIN_IP_REFILL_SECONDS)
+
+_bcrypt_executor: Optional[ThreadPoolExecutor] = None
+_bcrypt_lock = threading.Lock()
+_bcrypt_slots = threading.BoundedSemaphore(BCRYPT_WORKERS + BCRYPT_MAX_PENDING)
+
+def _client_ip() -> Optional[str]:
+    """The client's IP address, or None when Streamlit can't tell"""
+    try:
+        return st.context.ip_address or None
+    except Exception:
+        return None
 
 def initialize_session_state():
     """Initialize session state variables"""
@@ -20,59 +97,89 @@ def verify_password(password: str, hashed: str) -> bool:
     """Verify password against hash"""
     return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
 
+def _get_bcrypt_executor() -> ThreadPoolExecutor:
+    global _bcrypt_executor
+    if _bcrypt_executor is None:
+        with _bcrypt_lock:
+            if _bcrypt_executor is None:
+                _bcrypt_executor = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix="bcrypt")
+    return _bcrypt_executor
+
+@timed()
+def check_password(password: str, hashed: str) -> bool:
+    """Verify a password on the bounded bcrypt pool.
+
+    Raises LoginThrottled when the pool already has BCRYPT_MAX_PENDING
+    checks waiting.
+    """
+    if not _bcrypt_slots.acquire(blocking=False):
+        raise LoginThrottled(1.0)
+    try:
+        return _get_bcrypt_executor().submit(verify_password, password, hashed).result()
+    finally:
+        _bcrypt_slots.release()
+
 def create_admin_user():
     """Create default admin user if not exists"""
-    ensure_admin_users_table()  # Ensure table exists before querying
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    # Check if admin exists
-    cursor.execute("SELECT username FROM admin_users WHERE username = ?", ("artificial_intelligence",))
-    if not cursor.fetchone():
-        hashed_password = hash_password("challan_app")
-        cursor.execute(
-            "INSERT INTO admin_users (username, password_hash, email) VALUES (?, ?, ?)",
-            ("artificial_intelligence", hashed_password, "admin@university.edu")
-        )
-        conn.commit()
-    
-    conn.close()
+    with connection() as conn:
+        cursor = conn.cursor()
+        
+        # Check if admin exists
+        cursor.execute("SELECT username FROM admin_users WHERE username = ?", ("artificial_intelligence",))
+        if not cursor.fetchone():
+            hashed_password = hash_password("challan_app")
+            cursor.execute(
+                "INSERT INTO admin_users (username, password_hash, email) VALUES (?, ?, ?)",
+                ("artificial_intelligence", hashed_password, "admin@university.edu")
+            )
 
 def login(username: str, password: str, is_admin_login: bool = False) -> bool:
-    """Authenticate user"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    
+    """Authenticate user.
+
+    Admin attempts are rate limited per client IP and per username; raises
+    LoginThrottled when an attempt is refused.
+    """
     if is_admin_login:
-        # Admin login with new credentials
-        cursor.execute("SELECT password_hash FROM admin_users WHERE username = ?", (username,))
-        result = cursor.fetchone()
+        # The username bucket is only charged for attempts the IP bucket
+        # lets through, so an already-limited client cannot lock the user out.
+        # Clients with no known IP would all share one bucket, so they are
+        # limited per username only
+        ip = _client_ip()
+        retry_after = (_ip_buckets.take(ip) if ip else 0.0) or _user_buckets.take(username)
+        if retry_after:
+            raise LoginThrottled(retry_after)
+        
+        # Admin login with new credentials; the hash is read first so no
+        # pooled connection is held while the check waits for the bcrypt pool
+        with connection() as conn:
+            result = conn.execute("SELECT password_hash FROM admin_users WHERE username = ?",
+                                  (username,)).fetchone()
         
-        if result and verify_password(password, result[0]):
+        if result and check_password(password, result[0]):
+            _user_buckets.reset(username)
             st.session_state.authenticated = True
             st.session_state.username = username
             st.session_state.is_admin = True
-            conn.close()
-            return True
-    else:
-        # Student login - for demo, accept any roll number with password "student123"
-        if password == "student123":
-            st.session_state.authenticated = True
-            st.session_state.username = username
-            st.session_state.is_admin = False
-            conn.close()
             return True
-        
-        # Check if student exists in database
+        return False
+    
+    # Student login - for demo, accept any roll number with password "student123"
+    if password == "student123":
+        st.session_state.authenticated = True
+        st.session_state.username = username
+        st.session_state.is_admin = False
+        return True
+    
+    # Check if student exists in database
+    with connection() as conn:
+        cursor = conn.cursor()
         cursor.execute("SELECT roll_number FROM student_challans WHERE roll_number = ?", (username,))
         if cursor.fetchone() and password == "student123":
             st.session_state.authenticated = True
             st.session_state.username = username
             st.session_state.is_admin = False
-            conn.close()
             return True
     
-    conn.close()
     return False
 
 def logout():
@@ -93,5 +200,23 @@ def get_current_user() -> str:
     """Get current username"""
     return st.session_state.get('username', "")
 
-# Create admin user on import
-create_admin_user()
+_bootstrapped = False
+_bootstrap_lock = threading.Lock()
+
+def bootstrap():
+    """Migrate the database, create the default admin and start background work once per process.
+
+    Streamlit calls main() on every rerun; after the first call this is a
+    flag check, so warm reruns run no DDL and no queries.
+    """
+    global _bootstrapped
+    if _bootstrapped:
+        return
+    with _bootstrap_lock:
+        if not _bootstrapped:
+            init_database()
+            create_admin_user()
+            # Deliver anything left in the outbox by a previous run
+            get_email_dispatcher().start()
+            start_metrics_writer()
+            _bootstrapped = True
@@ -0,0 +1,550 @@
+"""Micro-benchmarks for the challan data layer.
+
+Usage:
+    python benchmark.py pool [--ops 2000]
+    python benchmark.py pdf [--count 200]
+    python benchmark.py startup [--reruns 200]
+    python benchmark.py present [--rows 10000 100000 1000000]
+    python benchmark.py arrow [--rows 200000]
+    python benchmark.py suite [--rows 10000 100000 1000000] [--ops 200] [--threads 8] [--output results.json]
+    python benchmark.py compare BASELINE.json CURRENT.json [--threshold 10]
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+import db
+import exporter
+import pdf_generator
+import presentation
+import utils
+
+SEMESTERS = ["1st Semester", "2nd Semester", "3rd Semester", "4th Semester",
+             "5th Semester", "6th Semester", "7th Semester", "8th Semester"]
+
+def sample_challan(i: int, students: int = 5000) -> dict:
+    """Build a synthetic challan record"""
+    created = datetime(2025, 1, 1) + timedelta(minutes=i)
+    return {
+        'student_name': f"Student {i}",
+        'roll_number': f"2021-CS-{i % students:04d}",
+        'id_card_number': f"{31200_0000000 + i:013d}",
+        'semester': SEMESTERS[i % len(SEMESTERS)],
+        'amount': 500 + (i % 10) * 100,
+        'reason': "Late registration" if i % 2 else "Library fine",
+        'created_date': created.strftime('%Y-%m-%d %H:%M:%S'),
+        'valid_till': (created + timedelta(days=3)).strftime('%Y-%m-%d'),
+        'status': 'pending'
+    }
+
+def _legacy_connection():
+    # The pre-pool behaviour: makedirs + fresh connect on every call
+    os.makedirs(os.path.dirname(db.DB_PATH), exist_ok=True)
+    conn = sqlite3.connect(db.DB_PATH)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def _legacy_insert(challan: dict):
+    conn = _legacy_connection()
+    conn.execute("""
+        INSERT INTO student_challans
+        (student_name, roll_number, id_card_number, semester, amount, reason, created_date, valid_till, status)
+        VALUES (:student_name, :roll_number, :id_card_number, :semester, :amount, :reason, :created_date, :valid_till, :status)
+    """, challan)
+    conn.commit()
+    conn.close()
+
+def _legacy_get_student(roll_number: str):
+    conn = _legacy_connection()
+    rows = conn.execute(
+        "SELECT * FROM student_challans WHERE roll_number = ? ORDER BY created_date DESC",
+        (roll_number,)
+    ).fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+def _ops_per_sec(fn, ops: int) -> float:
+    start = time.perf_counter()
+    for i in range(ops):
+        fn(i)
+    return ops / (time.perf_counter() - start)
+
+def bench_pool(ops: int):
+    """Compare per-call connect/close against the pooled connection layer"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db.configure_database(os.path.join(tmp, "bench.db"))
+        db.init_database()
+
+        results = {
+            'insert (legacy)': _ops_per_sec(lambda i: _legacy_insert(sample_challan(i)), ops),
+            'insert (pooled)': _ops_per_sec(lambda i: db.insert_challan(sample_challan(i)), ops),
+            'get_student (legacy)': _ops_per_sec(lambda i: _legacy_get_student(f"2021-CS-{i % 5000:04d}"), ops),
+            'get_student (pooled)': _ops_per_sec(lambda i: db.get_student_challans(f"2021-CS-{i % 5000:04d}"), ops),
+        }
+        db.close_pool()
+
+    for name, rate in results.items():
+        print(f"{name:<24} {rate:>10,.0f} ops/sec")
+
+def _pdfs_per_sec(fn, count: int) -> float:
+    start = time.perf_counter()
+    fn()
+    return count / (time.perf_counter() - start)
+
+def _inline_challan_pdf(challan) -> bytes:
+    """The pre-template routine: every element drawn straight onto the page, no form XObject"""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+    
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
+    pdf_generator._draw_template(c)
+    pdf_generator._draw_fields(c, pdf_generator._challan_fields(challan))
+    c.showPage()
+    c.save()
+    return buffer.getvalue()
+
+def bench_pdf(count: int):
+    """Compare PDF throughput of the template form against drawing everything inline"""
+    challans = [sample_challan(i) for i in range(count)]
+
+    results = {
+        'one file each (inline, old)': _pdfs_per_sec(lambda: [_inline_challan_pdf(c) for c in challans], count),
+        'one file each (generate_challan_pdfs)': _pdfs_per_sec(lambda: pdf_generator.generate_challan_pdfs(challans), count),
+        'merged document (template form)': _pdfs_per_sec(
+            lambda: pdf_generator.generate_challan_pdfs(challans, merged=True), count),
+    }
+    for name, rate in results.items():
+        print(f"{name:<36} {rate:>8,.1f} PDFs/sec")
+
+# Modules Streamlit imports when the server starts app.py
+APP_MODULES = "auth, student, admin"
+
+def _legacy_rerun_setup():
+    # The setup that used to run on every rerun: init_database()'s CREATE
+    # TABLEs, then the admin table DDL and default-admin lookup
+    with db.connection() as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS student_challans (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, student_name TEXT NOT NULL,
+                roll_number TEXT NOT NULL, id_card_number TEXT NOT NULL, semester TEXT NOT NULL,
+                amount INTEGER NOT NULL, reason TEXT NOT NULL, created_date TEXT NOT NULL,
+                valid_till TEXT NOT NULL, status TEXT DEFAULT 'pending', receipt_path TEXT,
+                admin_comments TEXT, updated_date TEXT
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS admin_users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE NOT NULL,
+                password_hash TEXT NOT NULL, email TEXT, created_date TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+    with db.connection() as conn:
+        conn.execute("SELECT username FROM admin_users WHERE username = ?", ("artificial_intelligence",)).fetchone()
+
+def _subprocess_seconds(code: str, db_path: str) -> float:
+    # A fresh interpreter, so module imports are genuinely cold
+    script = f"import time; start = time.perf_counter(); {code}; print(time.perf_counter() - start)"
+    env = dict(os.environ, CHALLAN_DB_PATH=db_path)
+    output = subprocess.run([sys.executable, "-c", script], env=env, check=True,
+                            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    return float(output.stdout.strip().splitlines()[-1])
+
+def bench_startup(reruns: int):
+    """Profile cold start (imports, first bootstrap) and the per-rerun setup cost"""
+    import auth
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        results = {
+            'import app modules (cold process)': _subprocess_seconds(f"import {APP_MODULES}", path),
+            'import + bootstrap, new database': _subprocess_seconds(
+                f"import {APP_MODULES}; auth.bootstrap()", path),
+            'import + bootstrap, existing database': _subprocess_seconds(
+                f"import {APP_MODULES}; auth.bootstrap()", path),
+        }
+
+        db.configure_database(path)
+        auth.bootstrap()
+        start = time.perf_counter()
+        for _ in range(reruns):
+            _legacy_rerun_setup()
+        results['per rerun, DDL + admin lookup (before)'] = (time.perf_counter() - start) / reruns
+        start = time.perf_counter()
+        for _ in range(reruns):
+            auth.bootstrap()
+        results['per rerun, bootstrapped process'] = (time.perf_counter() - start) / reruns
+        db.close_pool()
+
+    for name, seconds in results.items():
+        print(f"{name:<40} {seconds * 1000:>10.3f} ms")
+
+DISPLAY_COLUMNS = ['id', 'student_name', 'roll_number', 'semester', 'amount', 'reason', 'status', 'created_date']
+
+def _legacy_frame(rows):
+    # Formatting as the views did it: DataFrame from dicts, full datetime
+    # parse, and a Python call per amount and per status
+    labels = presentation.STATUS_LABELS
+    df = pd.DataFrame(rows)
+    df['created_date'] = pd.to_datetime(df['created_date']).dt.strftime('%Y-%m-%d %H:%M')
+    df['amount'] = df['amount'].apply(lambda x: f"Rs. {x:,}")
+    df['status'] = df['status'].apply(lambda s: labels.get(s, s))
+    return df[DISPLAY_COLUMNS]
+
+def _seconds(fn) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+def bench_present(sizes):
+    """Compare per-element table formatting with the vectorized presentation path"""
+    for size in sizes:
+        records = [dict(sample_challan(i), id=i + 1) for i in range(size)]
+        tuples = [tuple(record[c] for c in DISPLAY_COLUMNS) for record in records]
+        results = {
+            'per-element (dict rows)': _seconds(lambda: _legacy_frame(records)),
+            'vectorized (dict rows)': _seconds(lambda: presentation.challan_frame(
+                records, DISPLAY_COLUMNS, presentation.STATUS_LABELS)),
+            'vectorized (cursor tuples)': _seconds(lambda: presentation.challan_frame(
+                tuples, DISPLAY_COLUMNS, presentation.STATUS_LABELS)),
+        }
+        del records, tuples
+        print(f"{size:,} rows")
+        for name, seconds in results.items():
+            print(f"  {name:<28} {seconds * 1000:>10.1f} ms")
+
+# Each read path runs in a fresh interpreter so its peak RSS is its own
+ARROW_PATHS = {
+    'dict rows + DataFrame (all columns)':
+        "rows = db.get_all_challans.uncached(); df = pd.DataFrame(rows)",
+    'Arrow table (all columns)':
+        "table = db.fetch_challans_arrow.uncached()",
+    'Arrow-backed DataFrame (all columns)':
+        "df = db.fetch_challans_frame()",
+    'Arrow-backed DataFrame (display columns)':
+        f"df = db.fetch_challans_frame({DISPLAY_COLUMNS!r})",
+}
+
+def _measure_read(code: str, db_path: str):
+    script = f"""
+import resource, time
+import pandas as pd, pyarrow
+import db
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - start
+print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before)
+"""
+    env = dict(os.environ, CHALLAN_DB_PATH=db_path)
+    output = subprocess.run([sys.executable, "-c", script], env=env, check=True,
+                            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    seconds, peak_kb = output.stdout.strip().splitlines()[-1].split()
+    return float(seconds), int(peak_kb) / 1024
+
+def bench_arrow(rows: int):
+    """Compare load time and peak memory of the dict and Arrow read paths"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        db.configure_database(path)
+        db.init_database()
+        for start in range(0, rows, 10_000):
+            db.insert_challans([dict(sample_challan(i), status='pending')
+                                for i in range(start, min(rows, start + 10_000))])
+        db.close_pool()
+
+        print(f"{rows:,} rows")
+        for name, code in ARROW_PATHS.items():
+            seconds, peak_mb = _measure_read(code, path)
+            print(f"  {name:<42} {seconds * 1000:>9.0f} ms  {peak_mb:>8.1f} MB peak")
+
+# Synthetic datasets average this many challans per student
+CHALLANS_PER_STUDENT = 5
+SEED_BATCH = 10_000
+
+def _students(rows: int) -> int:
+    return max(1000, rows // CHALLANS_PER_STUDENT)
+
+def _remove_database(path: str):
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+def seed_database(path: str, rows: int):
+    """Create (or reuse) a template database at path holding exactly rows synthetic challans
+
+    Runs work on a copy (see copy_database), so the template keeps ids
+    1..rows and can be reused as-is by later runs.
+    """
+    if os.path.exists(path):
+        db.configure_database(path)
+        with db.connection() as conn:
+            existing = conn.execute("SELECT COUNT(*) FROM student_challans").fetchone()[0]
+        db.close_pool()
+        if existing == rows:
+            return
+        # Start from a fresh file so AUTOINCREMENT ids begin at 1 again
+        _remove_database(path)
+    db.configure_database(path)
+    db.init_database()
+    students = _students(rows)
+    for start in range(0, rows, SEED_BATCH):
+        # A realistic status mix so the stats and filters have work to do
+        db.insert_challans([
+            dict(sample_challan(i, students), status=utils.CHALLAN_STATUSES[i % 7 % 4])
+            for i in range(start, min(rows, start + SEED_BATCH))
+        ])
+    db.close_pool()
+
+def copy_database(template: str, path: str):
+    """Copy a seeded template to path (through the backup API, so WAL content is included)"""
+    _remove_database(path)
+    source = sqlite3.connect(template)
+    target = sqlite3.connect(path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+def _percentile(sorted_values, pct: float) -> float:
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def _summary(latencies) -> dict:
+    """Latency percentiles in milliseconds"""
+    values = sorted(latencies)
+    return {
+        'ops': len(values),
+        'mean_ms': sum(values) / len(values) * 1000,
+        'p50_ms': _percentile(values, 50) * 1000,
+        'p95_ms': _percentile(values, 95) * 1000,
+        'p99_ms': _percentile(values, 99) * 1000,
+        'max_ms': values[-1] * 1000,
+    }
+
+def _time_ops(fn, ops: int) -> dict:
+    latencies = []
+    for i in range(ops):
+        start = time.perf_counter()
+        fn(i)
+        latencies.append(time.perf_counter() - start)
+    return _summary(latencies)
+
+def _remove(path: str):
+    os.remove(path)
+
+def _single_paths(rows: int, ops: int) -> dict:
+    """Time each key path on its own; database reads bypass the query cache"""
+    students = _students(rows)
+    roll = lambda i: f"2021-CS-{(i * 7919) % students:04d}"
+    heavy = max(1, ops // 100)
+    challans = [dict(sample_challan(rows + i, students)) for i in range(max(1, ops // 4))]
+    page = db.get_all_challans.uncached(limit=1000)
+    return {
+        'insert_challan': _time_ops(lambda i: db.insert_challan(sample_challan(rows + i, students)), ops),
+        'get_student_challans': _time_ops(lambda i: db.get_student_challans.uncached(roll(i)), ops),
+        'get_student_challans (cached)': _time_ops(lambda i: db.get_student_challans(roll(i % 10)), ops),
+        'get_challan': _time_ops(lambda i: db.get_challan.uncached(1 + i % rows), ops),
+        'get_challan (cached)': _time_ops(lambda i: db.get_challan(1 + i % 10), ops),
+        'get_all_challans (limit 50)': _time_ops(lambda i: db.get_all_challans.uncached(limit=50), ops),
+        'get_all_challans (no limit)': _time_ops(lambda i: db.get_all_challans.uncached(), heavy),
+        'query_challans (status page)': _time_ops(
+            lambda i: db.query_challans.uncached(status='pending'), ops),
+        'get_challan_stats': _time_ops(lambda i: db.get_challan_stats.uncached(), ops),
+        'export_to_csv (1000 rows)': _time_ops(lambda i: utils.export_to_csv(page), max(1, ops // 10)),
+        'export_challans (csv, all rows)': _time_ops(lambda i: _remove(exporter.export_challans('csv')), heavy),
+        'generate_challan_pdf': _time_ops(lambda i: pdf_generator.generate_challan_pdf(challans[i]), len(challans)),
+    }
+
+def _cache_speedups(paths: dict) -> dict:
+    """Uncached over cached p50 for each path timed both ways"""
+    return {
+        name: summary['p50_ms'] / paths[f"{name} (cached)"]['p50_ms']
+        for name, summary in paths.items()
+        if f"{name} (cached)" in paths and paths[f"{name} (cached)"]['p50_ms']
+    }
+
+# Relative frequency of each operation in the concurrent mix, modelled on
+# deadline week: mostly students checking their challans
+MIX_WEIGHTS = {
+    'get_student_challans': 50,
+    'query_challans': 20,
+    'insert_challan': 15,
+    'get_challan_stats': 10,
+    'update_challan_status': 5,
+}
+
+def _concurrent_mix(rows: int, ops: int, threads: int) -> dict:
+    """Run a weighted mix of operations from many threads through the normal (cached) API"""
+    students = _students(rows)
+    operations = {
+        'get_student_challans': lambda rng: db.get_student_challans(f"2021-CS-{rng.randrange(students):04d}"),
+        'query_challans': lambda rng: db.query_challans(status=rng.choice(utils.CHALLAN_STATUSES)),
+        'insert_challan': lambda rng: db.insert_challan(sample_challan(rows + rng.randrange(10 ** 6), students)),
+        'get_challan_stats': lambda rng: db.get_challan_stats(),
+        'update_challan_status': lambda rng: db.update_challan_status(
+            rng.randrange(1, rows + 1), rng.choice(('approved', 'rejected'))),
+    }
+    names = list(MIX_WEIGHTS)
+    weights = [MIX_WEIGHTS[name] for name in names]
+    latencies = {name: [] for name in names}
+    lock = threading.Lock()
+
+    def worker(seed: int):
+        rng = random.Random(seed)
+        local = {name: [] for name in names}
+        for _ in range(ops):
+            name = rng.choices(names, weights)[0]
+            start = time.perf_counter()
+            operations[name](rng)
+            local[name].append(time.perf_counter() - start)
+        with lock:
+            for name, values in local.items():
+                latencies[name].extend(values)
+
+    workers = [threading.Thread(target=worker, args=(seed,)) for seed in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    return {
+        'threads': threads,
+        'ops': ops * threads,
+        'ops_per_sec': ops * threads / elapsed,
+        'overall': _summary([v for values in latencies.values() for v in values]),
+        'operations': {name: _summary(values) for name, values in latencies.items() if values},
+    }
+
+def bench_suite(sizes, ops: int, threads: int, output: str, db_dir: str = None):
+    """Seed each dataset size, time the key paths alone and under a concurrent mix, write JSON"""
+    results = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'ops': ops,
+            'threads': threads,
+        },
+        'datasets': {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in sizes:
+            template = os.path.join(db_dir or tmp, f"bench_{rows}.db")
+            path = os.path.join(tmp, f"bench_{rows}.run.db")
+            start = time.perf_counter()
+            seed_database(template, rows)
+            # The suite inserts and updates rows, so it runs on a throwaway copy
+            copy_database(template, path)
+            db.configure_database(path)
+            print(f"{rows:,} rows (seeded in {time.perf_counter() - start:.1f}s)", file=sys.stderr)
+
+            paths = _single_paths(rows, ops)
+            for name, summary in paths.items():
+                print(f"  {name:<34} p50 {summary['p50_ms']:>9.2f} ms  p95 {summary['p95_ms']:>9.2f} ms",
+                      file=sys.stderr)
+            speedups = _cache_speedups(paths)
+            print(f"  {'cached reads (p50 speedup)':<34} "
+                  + ", ".join(f"{name} {ratio:.1f}x" for name, ratio in speedups.items()), file=sys.stderr)
+            mix = _concurrent_mix(rows, ops, threads)
+            print(f"  {'concurrent mix':<34} {mix['ops_per_sec']:>9,.0f} ops/sec  "
+                  f"p95 {mix['overall']['p95_ms']:.2f} ms", file=sys.stderr)
+
+            results['datasets'][str(rows)] = {'paths': paths, 'cache_speedup': speedups,
+                                            'concurrent_mix': mix}
+            db.close_pool()
+            _remove_database(path)
+            if db_dir is None:
+                _remove_database(template)
+
+    text = json.dumps(results, indent=2)
+    if output == "-":
+        print(text)
+    else:
+        with open(output, "w") as f:
+            f.write(text)
+        print(f"Results written to {output}", file=sys.stderr)
+
+def compare_results(baseline_path: str, current_path: str, threshold: float) -> bool:
+    """Print p95 changes between two suite runs; returns True if any path regressed beyond threshold %"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)['datasets']
+    with open(current_path) as f:
+        current = json.load(f)['datasets']
+
+    regressed = False
+    for rows in sorted(set(baseline) & set(current), key=int):
+        print(f"{int(rows):,} rows")
+        before = dict(baseline[rows]['paths'], **{'concurrent mix': baseline[rows]['concurrent_mix']['overall']})
+        after = dict(current[rows]['paths'], **{'concurrent mix': current[rows]['concurrent_mix']['overall']})
+        for name in before:
+            if name not in after:
+                continue
+            old, new = before[name]['p95_ms'], after[name]['p95_ms']
+            change = (new - old) / old * 100 if old else 0.0
+            flag = ""
+            if change > threshold:
+                flag = "  REGRESSION"
+                regressed = True
+            print(f"  {name:<34} p95 {old:>9.2f} -> {new:>9.2f} ms ({change:+.1f}%){flag}")
+    return regressed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    pool = sub.add_parser("pool", help="connection pool vs per-call connections")
+    pool.add_argument("--ops", type=int, default=2000)
+    pdf = sub.add_parser("pdf", help="challan PDF generation throughput")
+    pdf.add_argument("--count", type=int, default=200)
+    startup = sub.add_parser("startup", help="cold start and per-rerun setup cost")
+    startup.add_argument("--reruns", type=int, default=200)
+    present = sub.add_parser("present", help="challan table formatting")
+    present.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    arrow = sub.add_parser("arrow", help="dict rows vs Arrow columnar reads")
+    arrow.add_argument("--rows", type=int, default=200_000)
+    suite = sub.add_parser("suite", help="seeded datasets, key paths and a concurrent mix, as JSON")
+    suite.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    suite.add_argument("--ops", type=int, default=200, help="operations per path (and per thread in the mix)")
+    suite.add_argument("--threads", type=int, default=8)
+    suite.add_argument("--output", default="benchmark_results.json", help="JSON file, or - for stdout")
+    suite.add_argument("--db-dir", help="keep seeded databases here and reuse them on later runs")
+    compare = sub.add_parser("compare", help="compare two suite result files")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.add_argument("--threshold", type=float, default=10.0, help="p95 increase (%%) counted as a regression")
+    args = parser.parse_args()
+
+    if args.command == "pool":
+        bench_pool(args.ops)
+    elif args.command == "pdf":
+        bench_pdf(args.count)
+    elif args.command == "startup":
+        bench_startup(args.reruns)
+    elif args.command == "present":
+        bench_present(args.rows)
+    elif args.command == "arrow":
+        bench_arrow(args.rows)
+    elif args.command == "suite":
+        bench_suite(args.rows, args.ops, args.threads, args.output, args.db_dir)
+    elif args.command == "compare":
+        raise SystemExit(1 if compare_results(args.baseline, args.current, args.threshold) else 0)
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,206 @@
 import sqlite3
 import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
 from typing import List, Dict, Optional
+from query_cache import cached_query, bump_version, set_version_source
+from metrics import connection_factory, timed
+from pdf_store import invalidate_challan_pdfs
+
+DB_PATH = os.environ.get("CHALLAN_DB_PATH", os.path.join("data", "challans.db"))
+
+# Pool sizing and per-connection tuning. WAL lets readers run alongside a
+# writer, and NORMAL sync is durable across application crashes in WAL mode.
+POOL_SIZE = int(os.environ.get("CHALLAN_DB_POOL_SIZE", "8"))
+POOL_TIMEOUT = 30.0
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA foreign_keys = ON",
+)
 
 def get_connection():
-    """Get database connection"""
-    os.makedirs("data", exist_ok=True)
-    conn = sqlite3.connect("data/challans.db")
+    """Open a new tuned database connection (not pooled)"""
+    directory = os.path.dirname(DB_PATH)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(DB_PATH, timeout=5.0, check_same_thread=False, factory=connection_factory())
     conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
     return conn
 
-def init_database():
-    """Initialize database tables"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    
+class ConnectionPool:
+    """Thread-safe pool of reusable SQLite connections"""
+
+    def __init__(self, size: int = POOL_SIZE, timeout: float = POOL_TIMEOUT):
+        self.size = size
+        self.timeout = timeout
+        self.pid = os.getpid()
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._created = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+        if create:
+            try:
+                return get_connection()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError("Timed out waiting for a database connection")
+
+    def _release(self, conn: sqlite3.Connection):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put_nowait(conn)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; commit on success, roll back on error.
+
+        Nested use on the same thread reuses the outer connection so the
+        whole block runs as a single transaction.
+        """
+        held = getattr(self._local, "conn", None)
+        if held is not None:
+            yield held
+            return
+
+        conn = self._acquire()
+        self._local.conn = conn
+        changes = conn.total_changes
+        try:
+            yield conn
+            conn.commit()
+            if conn.total_changes != changes:
+                # Any committed write invalidates cached reads
+                bump_version()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            self._local.conn = None
+            self._release(conn)
+
+    def close(self):
+        """Close all idle connections"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    """Get the process-wide connection pool"""
+    global _pool
+    pool = _pool
+    # A forked child must not share the parent's SQLite handles
+    if pool is None or pool.pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool.pid != os.getpid():
+                _pool = ConnectionPool()
+            pool = _pool
+    return pool
+
+@contextmanager
+def connection():
+    """Borrow a pooled connection for the duration of a with-block"""
+    with get_pool().connection() as conn:
+        yield conn
+
+def close_pool():
+    """Close pooled connections (e.g. before switching databases)"""
+    global _pool, _watcher, _watched
+    with _pool_lock:
+        if _pool is not None and _pool.pid == os.getpid():
+            _pool.close()
+        _pool = None
+    with _watcher_lock:
+        if _watcher is not None and _watcher[0] == os.getpid():
+            _watcher[1].close()
+        _watcher = None
+        _watched = (None, 0, float('-inf'))
+
+# A connection that never writes, so its PRAGMA data_version changes on every
+# commit by any other connection: other Streamlit sessions, forked API
+# workers or the reconcile CLI. It keeps the query cache from serving rows
+# another process has since changed. Commits in this process bump the cache
+# version directly, so the pragma is only re-read every DATA_VERSION_INTERVAL
+# seconds; other processes' writes show up within that interval.
+DATA_VERSION_INTERVAL = 0.1
+_watcher = None
+_watcher_lock = threading.Lock()
+_watched = (None, 0, float('-inf'))
+
+def data_version() -> int:
+    """Counter that changes whenever the database is committed to from anywhere"""
+    global _watcher, _watched
+    pid, version, checked_at = _watched
+    if time.monotonic() - checked_at < DATA_VERSION_INTERVAL and pid == os.getpid():
+        return version
+    with _watcher_lock:
+        if _watcher is None or _watcher[0] != os.getpid():
+            directory = os.path.dirname(DB_PATH)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            _watcher = (os.getpid(), sqlite3.connect(DB_PATH, check_same_thread=False))
+        version = _watcher[1].execute("PRAGMA data_version").fetchone()[0]
+        _watched = (os.getpid(), version, time.monotonic())
+    return version
+
+set_version_source(data_version)
+
+def configure_database(path: str):
+    """Point the module at a different database file"""
+    global DB_PATH
+    close_pool()
+    DB_PATH = path
+
+CHALLAN_INDEXES = {
+    'idx_challans_created': "created_date, id",
+    'idx_challans_status_created': "status, created_date, id",
+    'idx_challans_semester_created': "semester, created_date, id",
+    'idx_challans_roll_created': "roll_number, created_date, id",
+}
+
+CHALLAN_PAGE_SIZE = 50
+
+# Full-text index over the searchable challan columns. The trigram tokenizer
+# (SQLite 3.34+) answers arbitrary substring queries; older SQLite builds fall
+# back to word-prefix matching.
+SEARCH_COLUMNS = ('student_name', 'roll_number', 'reason')
+FTS_TOKENIZER = 'trigram' if sqlite3.sqlite_version_info >= (3, 34, 0) else 'unicode61'
+
+def _create_base_tables(cursor: sqlite3.Cursor):
     # Student challans table
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS student_challans (
@@ -43,152 +230,902 @@ def init_database():
             created_date TEXT DEFAULT CURRENT_TIMESTAMP
         )
     """)
+
+def _create_challan_indexes(cursor: sqlite3.Cursor):
+    # Indexes serving the filtered, keyset-paginated listings. Each one
+    # ends in (created_date, id) so the ORDER BY needs no sort step; the
+    # roll_number one also serves the per-student lookup.
+    for name, columns in CHALLAN_INDEXES.items():
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON student_challans ({columns})")
+
+def _create_email_outbox(cursor: sqlite3.Cursor):
+    # Emails waiting for (or done with) background delivery; next_attempt is
+    # epoch seconds and doubles as the lease of a message being sent
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS email_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            to_email TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            body TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt REAL NOT NULL DEFAULT 0,
+            last_error TEXT,
+            created_date TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            sent_date TEXT
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_email_outbox_due ON email_outbox (status, next_attempt)")
+
+def _add_receipt_hash(cursor: sqlite3.Cursor):
+    # sha256 of the stored receipt file; receipts uploaded before content
+    # addressing keep their flat path and a NULL hash
+    cursor.execute("ALTER TABLE student_challans ADD COLUMN receipt_hash TEXT")
+
+def _add_challan_number(cursor: sqlite3.Cursor):
+    cursor.execute("ALTER TABLE student_challans ADD COLUMN challan_number TEXT")
+    # Existing challans are numbered by the year they were created in
+    rows = cursor.execute("SELECT id, substr(created_date, 1, 4) FROM student_challans").fetchall()
+    cursor.executemany(
+        "UPDATE student_challans SET challan_number = ? WHERE id = ?",
+        ((format_challan_number(challan_id, int(year) if year.isdigit() else 0), challan_id)
+         for challan_id, year in rows)
+    )
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_challans_number ON student_challans (challan_number)")
+
+def _create_roll_upper_index(cursor: sqlite3.Cursor):
+    # Bank statements quote roll numbers in any case; reconciliation
+    # matches on upper(roll_number), oldest challan first
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_challans_roll_upper "
+                   "ON student_challans (upper(roll_number), created_date, id)")
+
+# Schema changes in order; a database at PRAGMA user_version N has had the
+# first N applied. Only ever append: released entries must not change.
+# The first entries are idempotent so databases created before versioning
+# (user_version 0) are brought up to date safely.
+MIGRATIONS = (
+    _create_base_tables,
+    _create_challan_indexes,
+    lambda cursor: ensure_search_index(cursor),
+    lambda cursor: ensure_stats_table(cursor),
+    lambda cursor: ensure_monthly_rollup(cursor),
+    _create_email_outbox,
+    _add_receipt_hash,
+    _add_challan_number,
+    _create_roll_upper_index,
+)
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def schema_version() -> int:
+    """Get the database's applied migration count"""
+    with connection() as conn:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate() -> int:
+    """Apply pending migrations in one transaction; returns how many ran"""
+    with connection() as conn:
+        if not conn.in_transaction:
+            # Take the write lock before reading the version so concurrent
+            # deploys cannot both apply the same migration
+            conn.execute("BEGIN IMMEDIATE")
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version > SCHEMA_VERSION:
+            raise RuntimeError(f"Database schema version {version} is newer than this code ({SCHEMA_VERSION})")
+        
+        cursor = conn.cursor()
+        for migration in MIGRATIONS[version:]:
+            migration(cursor)
+        if version < SCHEMA_VERSION:
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        return SCHEMA_VERSION - version
+
+def init_database():
+    """Initialize database tables, migrating only if the schema is behind"""
+    # A single pragma read on every rerun; the write lock is only taken
+    # when there is something to apply
+    if schema_version() != SCHEMA_VERSION:
+        migrate()
+
+def ensure_search_index(cursor: sqlite3.Cursor):
+    """Create the FTS5 search table and its sync triggers, backfilling it once"""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'student_challans_fts'")
+    exists = cursor.fetchone() is not None
+    
+    columns = ", ".join(SEARCH_COLUMNS)
+    new_values = ", ".join(f"new.{c}" for c in SEARCH_COLUMNS)
+    old_values = ", ".join(f"old.{c}" for c in SEARCH_COLUMNS)
     
-    conn.commit()
-    conn.close()
+    cursor.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS student_challans_fts USING fts5(
+            {columns},
+            content='student_challans', content_rowid='id', tokenize='{FTS_TOKENIZER}'
+        )
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS student_challans_fts_insert AFTER INSERT ON student_challans BEGIN
+            INSERT INTO student_challans_fts (rowid, {columns}) VALUES (new.id, {new_values});
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS student_challans_fts_delete AFTER DELETE ON student_challans BEGIN
+            INSERT INTO student_challans_fts (student_challans_fts, rowid, {columns})
+            VALUES ('delete', old.id, {old_values});
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS student_challans_fts_update AFTER UPDATE OF {columns} ON student_challans BEGIN
+            INSERT INTO student_challans_fts (student_challans_fts, rowid, {columns})
+            VALUES ('delete', old.id, {old_values});
+            INSERT INTO student_challans_fts (rowid, {columns}) VALUES (new.id, {new_values});
+        END
+    """)
+    
+    if not exists:
+        # Existing databases: index the rows written before the table existed
+        cursor.execute("INSERT INTO student_challans_fts (student_challans_fts) VALUES ('rebuild')")
+
+def rebuild_search_index():
+    """Rebuild the full-text index from student_challans"""
+    with connection() as conn:
+        conn.execute("INSERT INTO student_challans_fts (student_challans_fts) VALUES ('rebuild')")
+
+def _fts_query(text: str, columns=SEARCH_COLUMNS) -> Optional[str]:
+    """Translate user search text into an FTS5 MATCH expression.
+
+    Returns None when the text is too short for the index to help.
+    """
+    text = " ".join(text.split())
+    if FTS_TOKENIZER == 'trigram':
+        if len(text) < 3:
+            return None
+        expression = '"' + text.replace('"', '""') + '"'
+    else:
+        words = [w for w in text.replace('"', ' ').split() if w]
+        if not words:
+            return None
+        expression = " ".join(f'"{w}"*' for w in words)
+    return "{" + " ".join(columns) + "}: " + expression
+
+@timed(rows=len)
+@cached_query
+def search_challan_ids(text: str, columns=SEARCH_COLUMNS, limit: Optional[int] = None) -> List[int]:
+    """Get IDs of challans (newest first) whose columns contain the text"""
+    columns = tuple(columns)
+    text = text.strip()
+    if not text:
+        return []
+    
+    expression = _fts_query(text, columns)
+    if expression is not None:
+        # FTS5 walks its posting lists in rowid order, so no sort is needed
+        query = ("SELECT rowid FROM student_challans_fts WHERE student_challans_fts MATCH ? "
+                 "ORDER BY rowid DESC")
+        params = [expression]
+    else:
+        clauses, params = _search_clause(text, columns)
+        query = f"SELECT id FROM student_challans WHERE {clauses[0]} ORDER BY id DESC"
+    if limit:
+        query += " LIMIT ?"
+        params.append(int(limit))
+    
+    with connection() as conn:
+        return [row[0] for row in conn.execute(query, params).fetchall()]
 
+def _like_pattern(text: str) -> str:
+    escaped = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+def _search_clause(text: str, columns):
+    """WHERE clause matching challans that contain text in any of the columns"""
+    text = text.strip()
+    if not text:
+        return [], []
+    expression = _fts_query(text, columns)
+    if expression is None:
+        # Too short for trigrams; a LIKE scan is the only option
+        pattern = _like_pattern(text)
+        clause = " OR ".join(f"{c} LIKE ? ESCAPE '\\'" for c in columns)
+        return [f"({clause})"], [pattern] * len(columns)
+    return ["id IN (SELECT rowid FROM student_challans_fts WHERE student_challans_fts MATCH ?)"], [expression]
+
+# Challan numbers are YY + the challan ID zero-padded to this many digits
+# + a Luhn check digit, e.g. 25 0012345 6; IDs beyond the width just make
+# the number longer, so numbers never collide
+CHALLAN_NUMBER_WIDTH = 7
+
+def luhn_check_digit(digits: str) -> int:
+    """Luhn check digit for a string of digits"""
+    total = 0
+    # Double every second digit from the right, starting with the last
+    for position, digit in enumerate(reversed(digits)):
+        value = int(digit)
+        if position % 2 == 0:
+            value *= 2
+            if value > 9:
+                value -= 9
+        total += value
+    return (10 - total % 10) % 10
+
+def format_challan_number(challan_id: int, year: int) -> str:
+    """Challan number for a challan ID issued in the given year"""
+    body = f"{year % 100:02d}{challan_id:0{CHALLAN_NUMBER_WIDTH}d}"
+    return f"{body}{luhn_check_digit(body)}"
+
+def is_valid_challan_number(number: str) -> bool:
+    """Check a challan number's shape and check digit (catches any single mistyped digit)"""
+    return (number.isdigit() and len(number) >= CHALLAN_NUMBER_WIDTH + 3
+            and luhn_check_digit(number[:-1]) == int(number[-1]))
+
+def _next_challan_id(conn: sqlite3.Connection) -> int:
+    # The caller must hold the write lock (BEGIN IMMEDIATE). IDs are assigned
+    # here rather than by SQLite so the challan number can be written in the
+    # same INSERT; like AUTOINCREMENT, IDs of deleted challans are never reused
+    return conn.execute("""
+        SELECT MAX(IFNULL((SELECT seq FROM sqlite_sequence WHERE name = 'student_challans'), 0),
+                   IFNULL((SELECT MAX(id) FROM student_challans), 0)) + 1
+    """).fetchone()[0]
+
+@timed()
 def insert_challan(challan_data: Dict) -> Optional[int]:
-    """Insert new challan"""
+    """Insert new challan, numbering it in the same transaction"""
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
+        with connection() as conn:
+            # Numbers come from the ID, so allocation is serialized by the
+            # write lock every insert takes anyway; no counter row is locked
+            if not conn.in_transaction:
+                conn.execute("BEGIN IMMEDIATE")
+            challan_id = _next_challan_id(conn)
+            
+            conn.execute("""
+                INSERT INTO student_challans 
+                (id, challan_number, student_name, roll_number, id_card_number, semester, amount, reason,
+                 created_date, valid_till, status)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                challan_id,
+                format_challan_number(challan_id, datetime.now().year),
+                challan_data['student_name'],
+                challan_data['roll_number'],
+                challan_data['id_card_number'],
+                challan_data['semester'],
+                challan_data['amount'],
+                challan_data['reason'],
+                challan_data['created_date'],
+                challan_data['valid_till'],
+                challan_data['status']
+            ))
+            
+            return challan_id
+    except Exception as e:
+        print(f"Error inserting challan: {e}")
+        return None
+
+# Per-row insert triggers that insert_challans() replaces with set-based catch-up
+INSERT_TRIGGERS = ('student_challans_fts_insert', 'challan_stats_insert', 'monthly_rollup_insert')
+
+@timed(rows=lambda count: count)
+def insert_challans(challans: List[Dict]) -> int:
+    """Insert many challans with one executemany; returns the number inserted.
+
+    The search index, counters and monthly rollup are brought up to date
+    with one set-based statement each instead of per-row triggers. Runs
+    inside the caller's transaction when called within connection(), so a
+    whole import can commit (or roll back) at once.
+    """
+    with connection() as conn:
+        # Hold the write lock so no other insert can interleave with the
+        # id range caught up below
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        last_id = _next_challan_id(conn) - 1
+        year = datetime.now().year
+        
+        # Schema changes are transactional: other connections never see the
+        # triggers missing, and a rollback restores them
+        for trigger in INSERT_TRIGGERS:
+            conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
         
-        cursor.execute("""
+        cursor = conn.executemany("""
             INSERT INTO student_challans 
-            (student_name, roll_number, id_card_number, semester, amount, reason, created_date, valid_till, status)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            (id, challan_number, student_name, roll_number, id_card_number, semester, amount, reason, created_date,
+             valid_till, status)
+            VALUES (:id, :challan_number, :student_name, :roll_number, :id_card_number, :semester, :amount, :reason,
+                    :created_date, :valid_till, :status)
         """, (
-            challan_data['student_name'],
-            challan_data['roll_number'],
-            challan_data['id_card_number'],
-            challan_data['semester'],
-            challan_data['amount'],
-            challan_data['reason'],
-            challan_data['created_date'],
-            challan_data['valid_till'],
-            challan_data['status']
+            dict(challan, id=challan_id, challan_number=format_challan_number(challan_id, year))
+            for challan_id, challan in enumerate(challans, start=last_id + 1)
         ))
+        inserted = cursor.rowcount
         
-        challan_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        return challan_id
-    except Exception as e:
-        print(f"Error inserting challan: {e}")
-        return None
+        columns = ", ".join(SEARCH_COLUMNS)
+        conn.execute(f"""
+            INSERT INTO student_challans_fts (rowid, {columns})
+            SELECT id, {columns} FROM student_challans WHERE id > ?
+        """, (last_id,))
+        conn.execute("""
+            INSERT INTO challan_stats (status, count, amount)
+            SELECT IFNULL(status, ''), COUNT(*), IFNULL(SUM(amount), 0)
+            FROM student_challans WHERE id > ? GROUP BY IFNULL(status, '')
+            UNION ALL
+            SELECT ?, COUNT(*), IFNULL(SUM(amount), 0) FROM student_challans WHERE id > ?
+            ON CONFLICT (status) DO UPDATE SET
+                count = count + excluded.count, amount = amount + excluded.amount
+        """, (last_id, STATS_TOTAL_KEY, last_id))
+        conn.execute("""
+            INSERT INTO monthly_rollup (month, semester, status, count, amount)
+            SELECT substr(created_date, 1, 7), semester, IFNULL(status, ''), COUNT(*), IFNULL(SUM(amount), 0)
+            FROM student_challans WHERE id > ?
+            GROUP BY 1, 2, 3
+            ON CONFLICT (month, semester, status) DO UPDATE SET
+                count = count + excluded.count, amount = amount + excluded.amount
+        """, (last_id,))
+        
+        cursor = conn.cursor()
+        ensure_search_index(cursor)
+        ensure_stats_table(cursor)
+        ensure_monthly_rollup(cursor)
+        return inserted
 
+@timed(rows=len)
+@cached_query
 def get_student_challans(roll_number: str) -> List[Dict]:
     """Get challans for specific student"""
-    conn = get_connection()
-    cursor = conn.cursor()
+    with connection() as conn:
+        cursor = conn.execute("""
+            SELECT * FROM student_challans 
+            WHERE roll_number = ? 
+            ORDER BY created_date DESC
+        """, (roll_number,))
+        
+        return [dict(row) for row in cursor.fetchall()]
+
+@timed()
+@cached_query
+def get_challan(challan_id: int) -> Optional[Dict]:
+    """Get one challan by ID, or None if it does not exist"""
+    with connection() as conn:
+        row = conn.execute("SELECT * FROM student_challans WHERE id = ?", (challan_id,)).fetchone()
+    return dict(row) if row else None
+
+@timed()
+@cached_query
+def get_challan_by_number(challan_number: str) -> Optional[Dict]:
+    """Get one challan by its challan number (a unique index lookup), or None"""
+    challan_number = "".join(ch for ch in str(challan_number) if ch.isdigit())
+    if not is_valid_challan_number(challan_number):
+        return None
+    with connection() as conn:
+        row = conn.execute("SELECT * FROM student_challans WHERE challan_number = ?", (challan_number,)).fetchone()
+    return dict(row) if row else None
+
+@timed(rows=len)
+@cached_query
+def get_all_challans(limit: Optional[int] = None) -> List[Dict]:
+    """Get all challans"""
+    query = "SELECT * FROM student_challans ORDER BY created_date DESC"
+    params = ()
+    if limit:
+        query += " LIMIT ?"
+        params = (int(limit),)
     
-    cursor.execute("""
-        SELECT * FROM student_challans 
-        WHERE roll_number = ? 
-        ORDER BY created_date DESC
-    """, (roll_number,))
+    with connection() as conn:
+        cursor = conn.execute(query, params)
+        return [dict(row) for row in cursor.fetchall()]
+
+def _challan_filters(status: Optional[str] = None, semester: Optional[str] = None,
+                     name: Optional[str] = None, roll_number: Optional[str] = None):
+    """Build a WHERE clause and parameters for the admin challan filters"""
+    clauses, params = [], []
+    if status:
+        clauses.append("status = ?")
+        params.append(status)
+    if semester:
+        clauses.append("semester = ?")
+        params.append(semester)
+    for text, column in ((name, 'student_name'), (roll_number, 'roll_number')):
+        if text:
+            search_clauses, search_params = _search_clause(text, (column,))
+            clauses.extend(search_clauses)
+            params.extend(search_params)
+    return clauses, params
+
+@timed(rows=lambda page: len(page['rows']))
+@cached_query
+def query_challans(status: Optional[str] = None, semester: Optional[str] = None,
+                   name: Optional[str] = None, roll_number: Optional[str] = None,
+                   limit: int = CHALLAN_PAGE_SIZE, after: Optional[tuple] = None) -> Dict:
+    """Get one page of challans matching the filters, newest first.
+
+    ``name`` and ``roll_number`` are case-insensitive substring searches.
+    Pass the returned ``next_cursor`` as ``after`` to fetch the next page;
+    it is None on the last page.
+    """
+    clauses, params = _challan_filters(status, semester, name, roll_number)
+    if after:
+        clauses.append("(created_date, id) < (?, ?)")
+        params.extend(after)
+    
+    query = "SELECT * FROM student_challans"
+    if clauses:
+        query += " WHERE " + " AND ".join(clauses)
+    # Fetch one extra row to learn whether another page exists
+    query += " ORDER BY created_date DESC, id DESC LIMIT ?"
+    params.append(int(limit) + 1)
     
-    results = cursor.fetchall()
-    conn.close()
+    with connection() as conn:
+        rows = [dict(row) for row in conn.execute(query, params).fetchall()]
     
-    return [dict(row) for row in results]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = (rows[-1]['created_date'], rows[-1]['id'])
+    
+    return {'rows': rows, 'next_cursor': next_cursor}
 
-def get_all_challans(limit: Optional[int] = None) -> List[Dict]:
-    """Get all challans"""
-    conn = get_connection()
-    cursor = conn.cursor()
+@timed()
+@cached_query
+def count_challans(status: Optional[str] = None, semester: Optional[str] = None,
+                   name: Optional[str] = None, roll_number: Optional[str] = None) -> int:
+    """Count the challans matching the query_challans filters"""
+    clauses, params = _challan_filters(status, semester, name, roll_number)
+    query = "SELECT COUNT(*) FROM student_challans"
+    if clauses:
+        query += " WHERE " + " AND ".join(clauses)
+    with connection() as conn:
+        return conn.execute(query, params).fetchone()[0]
+
+CHALLAN_COLUMNS = (
+    'id', 'student_name', 'roll_number', 'id_card_number', 'semester', 'amount', 'reason',
+    'created_date', 'valid_till', 'status', 'receipt_path', 'receipt_hash', 'admin_comments', 'updated_date',
+    'challan_number'
+)
+EXPORT_BATCH_SIZE = 5000
+
+def iter_challan_batches(columns: Optional[List[str]] = None, filters: Optional[Dict] = None,
+                         batch_size: int = EXPORT_BATCH_SIZE, limit: Optional[int] = None):
+    """Stream challans matching the filters as lists of row tuples, newest first.
+
+    Rows are pulled from the cursor with fetchmany, so memory stays bounded
+    by batch_size however large the result is.
+    """
+    columns = list(columns or CHALLAN_COLUMNS)
+    unknown = set(columns) - set(CHALLAN_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown challan columns: {', '.join(sorted(unknown))}")
     
-    query = "SELECT * FROM student_challans ORDER BY created_date DESC"
+    clauses, params = _challan_filters(**(filters or {}))
+    query = f"SELECT {', '.join(columns)} FROM student_challans"
+    if clauses:
+        query += " WHERE " + " AND ".join(clauses)
+    query += " ORDER BY created_date DESC, id DESC"
     if limit:
-        query += f" LIMIT {limit}"
+        query += " LIMIT ?"
+        params.append(int(limit))
     
-    cursor.execute(query)
-    results = cursor.fetchall()
-    conn.close()
+    with connection() as conn:
+        # Plain tuples straight from the cursor; no sqlite3.Row per row
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+
+INTEGER_COLUMNS = {'id', 'amount'}
+
+def challan_arrow_schema(columns: List[str]):
+    """Arrow schema for the given challan columns"""
+    import pyarrow as pa
+    
+    return pa.schema([(c, pa.int64() if c in INTEGER_COLUMNS else pa.string()) for c in columns])
+
+def rows_to_record_batch(rows: List[tuple], schema):
+    """Convert row tuples to an Arrow record batch, one column array at a time"""
+    import pyarrow as pa
+    
+    arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*rows), schema)]
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+@timed(rows=lambda table: table.num_rows)
+@cached_query
+def fetch_challans_arrow(columns: Optional[List[str]] = None, filters: Optional[Dict] = None,
+                         limit: Optional[int] = None, batch_size: int = EXPORT_BATCH_SIZE):
+    """Get challans matching the filters as a pyarrow Table, newest first.
+
+    Only the requested columns are selected, and each fetchmany batch is
+    converted to columnar arrays straight away, so no per-row dicts are
+    built. Tables are immutable, which makes them safe to share from the
+    query cache.
+    """
+    import pyarrow as pa
     
-    return [dict(row) for row in results]
+    columns = list(columns or CHALLAN_COLUMNS)
+    schema = challan_arrow_schema(columns)
+    batches = [rows_to_record_batch(rows, schema)
+               for rows in iter_challan_batches(columns, filters, batch_size, limit)]
+    return pa.Table.from_batches(batches, schema=schema)
 
+def fetch_challans_frame(columns: Optional[List[str]] = None, filters: Optional[Dict] = None,
+                         limit: Optional[int] = None):
+    """Get challans matching the filters as a pandas DataFrame backed by Arrow arrays"""
+    import pandas as pd
+    
+    return fetch_challans_arrow(columns, filters, limit).to_pandas(types_mapper=pd.ArrowDtype)
+
+@timed()
 def update_challan_status(challan_id: int, status: str, comments: str = "") -> bool:
     """Update challan status"""
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            UPDATE student_challans 
-            SET status = ?, admin_comments = ?, updated_date = CURRENT_TIMESTAMP
-            WHERE id = ?
-        """, (status, comments, challan_id))
-        
-        conn.commit()
-        conn.close()
-        return True
+        with connection() as conn:
+            conn.execute("""
+                UPDATE student_challans 
+                SET status = ?, admin_comments = ?, updated_date = CURRENT_TIMESTAMP
+                WHERE id = ?
+            """, (status, comments, challan_id))
     except Exception as e:
         print(f"Error updating challan status: {e}")
         return False
+    # The status is part of the PDF's content key; drop the stale copy
+    invalidate_challan_pdfs([challan_id])
+    return True
+
+BULK_CHUNK_SIZE = 500
 
-def update_receipt_upload(challan_id: int, receipt_path: str) -> bool:
-    """Update receipt path for challan"""
+@timed()
+def bulk_update_challan_status(status: str, comments: str = "",
+                               challan_ids: Optional[List[int]] = None,
+                               filters: Optional[Dict] = None) -> Dict[int, str]:
+    """Set the status of many challans in a single transaction.
+
+    Targets either the given ``challan_ids`` or every challan matching
+    ``filters`` (the keyword arguments of query_challans). Returns the
+    outcome per challan ID: 'updated', 'unchanged' (already in that status),
+    'not_found' or, if the transaction failed, 'error'. With filters there
+    are no IDs to report a failure against, so the error is raised instead.
+    """
+    if challan_ids is None and filters is None:
+        raise ValueError("Pass challan_ids or filters")
+    
+    requested = list(dict.fromkeys(int(i) for i in challan_ids)) if challan_ids is not None else []
+    outcomes = {}
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            UPDATE student_challans 
-            SET receipt_path = ?, status = 'paid', updated_date = CURRENT_TIMESTAMP
-            WHERE id = ?
-        """, (receipt_path, challan_id))
-        
-        conn.commit()
-        conn.close()
-        return True
+        with connection() as conn:
+            # Take the write lock up front so the rows read below can't change
+            # before they are updated
+            if not conn.in_transaction:
+                conn.execute("BEGIN IMMEDIATE")
+            
+            current = {}
+            if challan_ids is not None:
+                for start in range(0, len(requested), BULK_CHUNK_SIZE):
+                    chunk = requested[start:start + BULK_CHUNK_SIZE]
+                    placeholders = ", ".join("?" * len(chunk))
+                    for row in conn.execute(
+                        f"SELECT id, status FROM student_challans WHERE id IN ({placeholders})", chunk
+                    ):
+                        current[row[0]] = row[1]
+                outcomes = {i: 'not_found' for i in requested if i not in current}
+            else:
+                clauses, params = _challan_filters(**filters)
+                query = "SELECT id, status FROM student_challans"
+                if clauses:
+                    query += " WHERE " + " AND ".join(clauses)
+                current = {row[0]: row[1] for row in conn.execute(query, params)}
+            
+            to_update = [i for i, current_status in current.items() if current_status != status]
+            conn.executemany("""
+                UPDATE student_challans 
+                SET status = ?, admin_comments = ?, updated_date = CURRENT_TIMESTAMP
+                WHERE id = ?
+            """, ((status, comments, i) for i in to_update))
+            
+            for i, current_status in current.items():
+                outcomes[i] = 'unchanged' if current_status == status else 'updated'
+    except Exception as e:
+        print(f"Error bulk updating challan status: {e}")
+        if challan_ids is None:
+            raise
+        return {i: 'error' for i in requested}
+    
+    invalidate_challan_pdfs(i for i, outcome in outcomes.items() if outcome == 'updated')
+    return outcomes
+
+def update_receipt_upload(challan_id: int, receipt_path: str, receipt_hash: Optional[str] = None) -> bool:
+    """Update receipt path (and content hash) for challan"""
+    try:
+        with connection() as conn:
+            conn.execute("""
+                UPDATE student_challans 
+                SET receipt_path = ?, receipt_hash = ?, status = 'paid', updated_date = CURRENT_TIMESTAMP
+                WHERE id = ?
+            """, (receipt_path, receipt_hash, challan_id))
     except Exception as e:
         print(f"Error updating receipt: {e}")
         return False
+    invalidate_challan_pdfs([challan_id])
+    return True
 
-def get_challan_stats() -> Dict:
-    """Get challan statistics"""
-    conn = get_connection()
-    cursor = conn.cursor()
+# Key of the challan_stats row holding totals across all statuses
+STATS_TOTAL_KEY = '*'
+
+def _stats_upsert(status_expr: str, count: str, amount: str) -> str:
+    return f"""
+            INSERT INTO challan_stats (status, count, amount) VALUES ({status_expr}, {count}, {amount})
+            ON CONFLICT (status) DO UPDATE SET
+                count = count + excluded.count, amount = amount + excluded.amount;"""
+
+def ensure_stats_table(cursor: sqlite3.Cursor):
+    """Create the materialized challan counters and the triggers that maintain them.
+
+    The triggers fire inside the writing statement's transaction, so the
+    counters can never disagree with a committed student_challans row.
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'challan_stats'")
+    exists = cursor.fetchone() is not None
     
-    # Total count
-    cursor.execute("SELECT COUNT(*) as total FROM student_challans")
-    total = cursor.fetchone()['total']
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS challan_stats (
+            status TEXT PRIMARY KEY,
+            count INTEGER NOT NULL DEFAULT 0,
+            amount INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    """)
+    
+    total = f"'{STATS_TOTAL_KEY}'"
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS challan_stats_insert AFTER INSERT ON student_challans BEGIN
+            {_stats_upsert("IFNULL(new.status, '')", "1", "new.amount")}
+            {_stats_upsert(total, "1", "new.amount")}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS challan_stats_delete AFTER DELETE ON student_challans BEGIN
+            {_stats_upsert("IFNULL(old.status, '')", "-1", "-old.amount")}
+            {_stats_upsert(total, "-1", "-old.amount")}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS challan_stats_update AFTER UPDATE OF status, amount ON student_challans
+        WHEN old.status IS NOT new.status OR old.amount IS NOT new.amount BEGIN
+            {_stats_upsert("IFNULL(old.status, '')", "-1", "-old.amount")}
+            {_stats_upsert("IFNULL(new.status, '')", "1", "new.amount")}
+            {_stats_upsert(total, "0", "new.amount - old.amount")}
+        END
+    """)
     
-    # Status counts
+    if not exists:
+        _recompute_stats(cursor)
+
+def _recompute_stats(cursor: sqlite3.Cursor):
+    cursor.execute("DELETE FROM challan_stats")
     cursor.execute("""
-        SELECT status, COUNT(*) as count 
-        FROM student_challans 
-        GROUP BY status
+        INSERT INTO challan_stats (status, count, amount)
+        SELECT IFNULL(status, ''), COUNT(*), IFNULL(SUM(amount), 0)
+        FROM student_challans GROUP BY IFNULL(status, '')
     """)
-    status_counts = {row['status']: row['count'] for row in cursor.fetchall()}
+    cursor.execute("""
+        INSERT INTO challan_stats (status, count, amount)
+        SELECT ?, COUNT(*), IFNULL(SUM(amount), 0) FROM student_challans
+    """, (STATS_TOTAL_KEY,))
+
+def rebuild_challan_stats():
+    """Recompute the challan counters from scratch"""
+    with connection() as conn:
+        _recompute_stats(conn.cursor())
+
+def verify_challan_stats() -> Dict:
+    """Compare the counters with a full recount.
+
+    Returns {status: (stored, actual)} for every mismatching row, where each
+    side is a (count, amount) tuple; an empty dict means the counters are
+    consistent.
+    """
+    with connection() as conn:
+        stored = {
+            row['status']: (row['count'], row['amount'])
+            for row in conn.execute("SELECT status, count, amount FROM challan_stats")
+            if row['count'] or row['amount']
+        }
+        actual = {
+            row[0]: (row[1], row[2])
+            for row in conn.execute("""
+                SELECT IFNULL(status, ''), COUNT(*), IFNULL(SUM(amount), 0)
+                FROM student_challans GROUP BY IFNULL(status, '')
+            """)
+        }
+        total = conn.execute("SELECT COUNT(*), IFNULL(SUM(amount), 0) FROM student_challans").fetchone()
+        if total[0]:
+            actual[STATS_TOTAL_KEY] = (total[0], total[1])
     
-    # Total amount
-    cursor.execute("SELECT SUM(amount) as total_amount FROM student_challans")
-    total_amount = cursor.fetchone()['total_amount'] or 0
+    return {
+        status: (stored.get(status), actual.get(status))
+        for status in stored.keys() | actual.keys()
+        if stored.get(status) != actual.get(status)
+    }
+
+@timed()
+@cached_query
+def get_challan_stats() -> Dict:
+    """Get challan statistics from the materialized counters"""
+    with connection() as conn:
+        rows = conn.execute("SELECT status, count, amount FROM challan_stats").fetchall()
     
-    conn.close()
+    counts = {row['status']: row['count'] for row in rows}
+    amounts = {row['status']: row['amount'] for row in rows}
     
     return {
-        'total': total,
-        'pending': status_counts.get('pending', 0),
-        'paid': status_counts.get('paid', 0),
-        'approved': status_counts.get('approved', 0),
-        'rejected': status_counts.get('rejected', 0),
-        'total_amount': total_amount
+        'total': counts.get(STATS_TOTAL_KEY, 0),
+        'pending': counts.get('pending', 0),
+        'paid': counts.get('paid', 0),
+        'approved': counts.get('approved', 0),
+        'rejected': counts.get('rejected', 0),
+        'total_amount': amounts.get(STATS_TOTAL_KEY, 0)
     }
 
-def ensure_admin_users_table():
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS admin_users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            email TEXT,
-            created_date TEXT DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    conn.commit()
-    conn.close()
+def _rollup_upsert(row: str, count: str, amount: str) -> str:
+    return f"""
+            INSERT INTO monthly_rollup (month, semester, status, count, amount)
+            VALUES (substr({row}.created_date, 1, 7), {row}.semester, IFNULL({row}.status, ''), {count}, {amount})
+            ON CONFLICT (month, semester, status) DO UPDATE SET
+                count = count + excluded.count, amount = amount + excluded.amount;"""
+
+def ensure_monthly_rollup(cursor: sqlite3.Cursor):
+    """Create the per-month rollup of challans and the triggers that maintain it"""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'monthly_rollup'")
+    exists = cursor.fetchone() is not None
+    
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS monthly_rollup (
+            month TEXT NOT NULL,
+            semester TEXT NOT NULL,
+            status TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            amount INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (month, semester, status)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS monthly_rollup_insert AFTER INSERT ON student_challans BEGIN
+            {_rollup_upsert("new", "1", "new.amount")}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS monthly_rollup_delete AFTER DELETE ON student_challans BEGIN
+            {_rollup_upsert("old", "-1", "-old.amount")}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS monthly_rollup_update
+        AFTER UPDATE OF status, amount, semester, created_date ON student_challans
+        WHEN old.status IS NOT new.status OR old.amount IS NOT new.amount
+            OR old.semester IS NOT new.semester OR old.created_date IS NOT new.created_date BEGIN
+            {_rollup_upsert("old", "-1", "-old.amount")}
+            {_rollup_upsert("new", "1", "new.amount")}
+        END
+    """)
+    
+    if not exists:
+        _recompute_monthly_rollup(cursor)
+
+def _recompute_monthly_rollup(cursor: sqlite3.Cursor):
+    cursor.execute("DELETE FROM monthly_rollup")
+    cursor.execute("""
+        INSERT INTO monthly_rollup (month, semester, status, count, amount)
+        SELECT substr(created_date, 1, 7), semester, IFNULL(status, ''), COUNT(*), IFNULL(SUM(amount), 0)
+        FROM student_challans
+        GROUP BY 1, 2, 3
+    """)
+
+def rebuild_monthly_rollup():
+    """Recompute the monthly rollup from scratch"""
+    with connection() as conn:
+        _recompute_monthly_rollup(conn.cursor())
+
+@timed(rows=len)
+@cached_query
+def get_monthly_series(by_semester: bool = False, by_status: bool = False,
+                       semester: Optional[str] = None, status: Optional[str] = None) -> List[Dict]:
+    """Get challan count and amount per month ('YYYY-MM'), oldest first.
+
+    With by_semester/by_status each month is further split into one row per
+    semester/status. semester and status restrict the series to one value.
+    """
+    keys = ['month']
+    if by_semester:
+        keys.append('semester')
+    if by_status:
+        keys.append('status')
+    
+    clauses, params = ["count != 0"], []
+    if semester:
+        clauses.append("semester = ?")
+        params.append(semester)
+    if status:
+        clauses.append("status = ?")
+        params.append(status)
+    
+    group = ", ".join(keys)
+    with connection() as conn:
+        cursor = conn.execute(f"""
+            SELECT {group}, SUM(count) AS count, SUM(amount) AS amount
+            FROM monthly_rollup
+            WHERE {" AND ".join(clauses)}
+            GROUP BY {group}
+            ORDER BY {group}
+        """, params)
+        return [dict(row) for row in cursor.fetchall()]
+
+# Hot read paths; each should be answered from an index without a sort
+PLAN_CHECKS = {
+    'challan number lookup': ("SELECT * FROM student_challans WHERE challan_number = ?", ('',)),
+    'login roll lookup': ("SELECT roll_number FROM student_challans WHERE roll_number = ?", ('',)),
+    'student challans': ("SELECT * FROM student_challans WHERE roll_number = ? ORDER BY created_date DESC", ('',)),
+    'latest page': ("SELECT * FROM student_challans ORDER BY created_date DESC, id DESC LIMIT ?", (51,)),
+    'status page': ("SELECT * FROM student_challans WHERE status = ? "
+                    "ORDER BY created_date DESC, id DESC LIMIT ?", ('pending', 51)),
+    'semester page': ("SELECT * FROM student_challans WHERE semester = ? "
+                      "ORDER BY created_date DESC, id DESC LIMIT ?", ('1st Semester', 51)),
+    'reconcile roll lookup': ("SELECT id FROM student_challans WHERE upper(roll_number) IN "
+                              "(SELECT value FROM json_each(?)) ORDER BY upper(roll_number), created_date, id",
+                              ('[]',)),
+}
+
+def explain_query(query: str, params=()) -> List[str]:
+    """Get SQLite's query plan for a statement, one line per step"""
+    with connection() as conn:
+        return [row['detail'] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params)]
+
+def check_query_plans() -> Dict[str, List[str]]:
+    """Get the plans of PLAN_CHECKS queries that scan the table or sort.
+
+    Returns {name: plan} for every offending query; an empty dict means all
+    of them are served by indexes.
+    """
+    problems = {}
+    for name, (query, params) in PLAN_CHECKS.items():
+        plan = explain_query(query, params)
+        if any(("SCAN" in step and "student_challans" in step and "USING" not in step)
+               or "TEMP B-TREE" in step for step in plan):
+            problems[name] = plan
+    return problems
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Challan database maintenance")
+    parser.add_argument("command", choices=[
+        "init", "migrate", "rebuild-stats", "verify-stats", "rebuild-search", "rebuild-rollup", "check-plans"
+    ])
+    args = parser.parse_args()
+    
+    if args.command == "migrate":
+        before = schema_version()
+        applied = migrate()
+        print(f"Schema version {before} -> {before + applied} ({applied} migration(s) applied).")
+        raise SystemExit(0)
+    
+    init_database()
+    if args.command == "rebuild-stats":
+        rebuild_challan_stats()
+        print("Challan statistics rebuilt.")
+    elif args.command == "verify-stats":
+        mismatches = verify_challan_stats()
+        for status, (stored, actual) in sorted(mismatches.items()):
+            print(f"{status or '(none)'}: stored={stored} actual={actual}")
+        print("Statistics OK." if not mismatches else "Statistics out of date; run rebuild-stats.")
+        raise SystemExit(1 if mismatches else 0)
+    elif args.command == "rebuild-search":
+        rebuild_search_index()
+        print("Search index rebuilt.")
+    elif args.command == "rebuild-rollup":
+        rebuild_monthly_rollup()
+        print("Monthly rollup rebuilt.")
+    elif args.command == "check-plans":
+        problems = check_query_plans()
+        for name, (query, params) in PLAN_CHECKS.items():
+            print(f"{name}{' (NOT INDEXED)' if name in problems else ''}:")
+            for step in explain_query(query, params):
+                print(f"    {step}")
+        raise SystemExit(1 if problems else 0)
@@ -0,0 +1,72 @@
+import csv
+import os
+import tempfile
+from typing import Dict, List, Optional
+from db import (CHALLAN_COLUMNS, EXPORT_BATCH_SIZE, iter_challan_batches, challan_arrow_schema,
+                rows_to_record_batch)
+from metrics import timed
+
+# format -> (mime type, file extension)
+EXPORT_FORMATS = {
+    'csv': ("text/csv", ".csv"),
+    'xlsx': ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", ".xlsx"),
+    'parquet': ("application/vnd.apache.parquet", ".parquet"),
+}
+
+@timed(nbytes=os.path.getsize)
+def export_challans(fmt: str = 'csv', columns: Optional[List[str]] = None,
+                    filters: Optional[Dict] = None, path: Optional[str] = None,
+                    batch_size: int = EXPORT_BATCH_SIZE) -> str:
+    """Stream challans into a CSV, XLSX or Parquet file and return its path.
+
+    Rows go from the database cursor to the file one batch at a time, so
+    peak memory is independent of the number of rows exported. When no path
+    is given a temporary file is created; the caller is responsible for
+    removing it.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    columns = list(columns or CHALLAN_COLUMNS)
+
+    if path is None:
+        fd, path = tempfile.mkstemp(prefix="challans_export_", suffix=EXPORT_FORMATS[fmt][1])
+        os.close(fd)
+
+    batches = iter_challan_batches(columns, filters, batch_size)
+    writer = {'csv': _write_csv, 'xlsx': _write_xlsx, 'parquet': _write_parquet}[fmt]
+    try:
+        writer(path, columns, batches)
+    except Exception:
+        os.remove(path)
+        raise
+    finally:
+        batches.close()
+
+    return path
+
+def _write_csv(path: str, columns: List[str], batches):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for batch in batches:
+            writer.writerows(batch)
+
+def _write_xlsx(path: str, columns: List[str], batches):
+    from openpyxl import Workbook
+
+    # Write-only workbooks stream rows to disk instead of keeping cells in memory
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Challans")
+    sheet.append(columns)
+    for batch in batches:
+        for row in batch:
+            sheet.append(row)
+    workbook.save(path)
+
+def _write_parquet(path: str, columns: List[str], batches):
+    import pyarrow.parquet as pq
+
+    schema = challan_arrow_schema(columns)
+    with pq.ParquetWriter(path, schema) as writer:
+        for batch in batches:
+            writer.write_batch(rows_to_record_batch(batch, schema))
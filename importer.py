@@ -0,0 +1,158 @@
+import csv
+import io
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+from db import insert_challans
+from metrics import timed
+from utils import validate_cnic, validate_amount, validate_semester, CHALLAN_STATUSES
+
+IMPORT_BATCH_SIZE = 5000
+# Per-row errors kept in the report; the counts always cover every row
+MAX_REPORTED_ERRORS = 10000
+
+REQUIRED_COLUMNS = ('student_name', 'roll_number', 'id_card_number', 'semester', 'amount', 'reason')
+OPTIONAL_COLUMNS = ('created_date', 'valid_till', 'status')
+
+def _iter_csv(source) -> Iterator[Tuple[int, Dict]]:
+    if isinstance(source, (str, os.PathLike)):
+        f = open(source, newline="", encoding="utf-8-sig")
+    else:
+        # Binary file-like objects such as Streamlit uploads
+        f = io.TextIOWrapper(source, newline="", encoding="utf-8-sig")
+    with f:
+        reader = csv.DictReader(f)
+        reader.fieldnames = [name.strip().lower() for name in reader.fieldnames or []]
+        # Line 1 is the header
+        for line_number, row in enumerate(reader, start=2):
+            yield line_number, row
+
+def _iter_xlsx(source) -> Iterator[Tuple[int, Dict]]:
+    from openpyxl import load_workbook
+
+    # read_only streams rows from the archive instead of loading every cell
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(name or "").strip().lower() for name in header]
+        for line_number, values in enumerate(rows, start=2):
+            if values is None or all(v is None for v in values):
+                continue
+            yield line_number, dict(zip(columns, values))
+    finally:
+        workbook.close()
+
+def iter_import_rows(source, fmt: str) -> Iterator[Tuple[int, Dict]]:
+    """Stream (row number, raw row) pairs from a CSV or XLSX path or binary file"""
+    if fmt == 'csv':
+        return _iter_csv(source)
+    if fmt == 'xlsx':
+        return _iter_xlsx(source)
+    raise ValueError(f"Unsupported import format: {fmt}")
+
+def _text(value) -> str:
+    return "" if value is None else str(value).strip()
+
+def _parse_datetime(value) -> datetime:
+    # Spreadsheet cells may already hold datetimes
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(_text(value))
+
+def validate_import_row(row: Dict, now: datetime) -> Tuple[Optional[Dict], List[str]]:
+    """Check one raw row; returns (challan record, []) or (None, errors)"""
+    errors = []
+    record = {column: _text(row.get(column)) for column in REQUIRED_COLUMNS}
+
+    for column in REQUIRED_COLUMNS:
+        if not record[column]:
+            errors.append(f"{column} is required")
+
+    if record['id_card_number'] and not validate_cnic(record['id_card_number']):
+        errors.append("id_card_number is not a valid 13-digit CNIC")
+    if record['semester'] and not validate_semester(record['semester']):
+        errors.append(f"unknown semester '{record['semester']}'")
+    if record['amount']:
+        if validate_amount(record['amount']):
+            record['amount'] = int(float(record['amount']))
+        else:
+            errors.append("amount must be a positive whole number")
+
+    # isoformat() produces the stored formats and is much cheaper than strftime()
+    created = now
+    try:
+        if _text(row.get('created_date')):
+            created = _parse_datetime(row.get('created_date'))
+        record['created_date'] = created.isoformat(sep=' ', timespec='seconds')
+    except ValueError:
+        errors.append("created_date must look like YYYY-MM-DD HH:MM:SS")
+    try:
+        valid_till = _parse_datetime(row.get('valid_till')) if _text(row.get('valid_till')) \
+            else created + timedelta(days=3)
+        record['valid_till'] = valid_till.date().isoformat()
+    except ValueError:
+        errors.append("valid_till must look like YYYY-MM-DD")
+
+    record['status'] = _text(row.get('status')).lower() or 'pending'
+    if record['status'] not in CHALLAN_STATUSES:
+        errors.append(f"unknown status '{record['status']}'")
+
+    return (None, errors) if errors else (record, [])
+
+@timed(rows=lambda report: report['imported'])
+def import_challans(source, fmt: str, batch_size: int = IMPORT_BATCH_SIZE,
+                    skip_invalid: bool = True) -> Dict:
+    """Validate challans from a CSV/XLSX file, then insert the valid ones.
+
+    The whole file is read and validated before anything is written, so
+    the database write lock is only held while rows are inserted. Valid
+    rows are inserted in batches of batch_size with executemany, each batch
+    committing on its own. With skip_invalid=False nothing is inserted if
+    any row is invalid, and otherwise all rows go in as one transaction.
+    Returns a report with row counts and the errors per row number.
+    """
+    report = {'total': 0, 'imported': 0, 'failed': 0, 'errors': []}
+    now = datetime.now().replace(microsecond=0)
+    records = []
+
+    try:
+        for line_number, row in iter_import_rows(source, fmt):
+            report['total'] += 1
+            record, errors = validate_import_row(row, now)
+            if errors:
+                report['failed'] += 1
+                if len(report['errors']) < MAX_REPORTED_ERRORS:
+                    report['errors'].append({'row': line_number, 'errors': errors})
+                continue
+            records.append(record)
+    except Exception as e:
+        print(f"Error reading import file: {e}")
+        report['errors'].append({'row': None, 'errors': [str(e)]})
+        return report
+
+    if report['failed'] and not skip_invalid:
+        return report
+
+    # All-or-nothing imports are one transaction; otherwise other writers
+    # (e.g. students creating challans) get the lock between batches
+    size = batch_size if skip_invalid else max(len(records), 1)
+    try:
+        for start in range(0, len(records), size):
+            report['imported'] += insert_challans(records[start:start + size])
+    except Exception as e:
+        print(f"Error importing challans: {e}")
+        report['errors'].append({'row': None, 'errors': [str(e)]})
+
+    return report
+
+def errors_to_csv(report: Dict) -> str:
+    """Render an import report's row errors as CSV"""
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(['row', 'errors'])
+    for entry in report['errors']:
+        writer.writerow([entry['row'], "; ".join(entry['errors'])])
+    return output.getvalue()
@@ -0,0 +1,342 @@
+import functools
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+# Instrumentation is on unless CHALLAN_METRICS=0; when off, timed() returns
+# functions unwrapped and connections use the plain sqlite3 classes
+METRICS_ENABLED = os.environ.get("CHALLAN_METRICS", "1") == "1"
+# Statements slower than this (including fetching their rows) go to the slow-query log
+SLOW_QUERY_MS = float(os.environ.get("CHALLAN_SLOW_QUERY_MS", "200"))
+# Optional file slow statements are appended to
+SLOW_QUERY_LOG = os.environ.get("CHALLAN_SLOW_QUERY_LOG", "")
+SLOW_QUERY_KEEP = 200
+# Optional Prometheus text file (e.g. for node_exporter's textfile collector),
+# rewritten every METRICS_FILE_INTERVAL seconds
+METRICS_FILE = os.environ.get("CHALLAN_METRICS_FILE", "")
+METRICS_FILE_INTERVAL = float(os.environ.get("CHALLAN_METRICS_FILE_INTERVAL", "15"))
+
+# Histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    """Call counter with a fixed-bucket latency histogram and row/byte totals"""
+
+    __slots__ = ('buckets', 'count', 'errors', 'total', 'max', 'rows', 'bytes')
+
+    def __init__(self):
+        # One extra bucket for observations above the last bound
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.bytes = 0
+
+    def observe(self, seconds: float, rows: Optional[int] = None, nbytes: Optional[int] = None,
+                error: bool = False):
+        index = 0
+        while index < len(LATENCY_BUCKETS) and seconds > LATENCY_BUCKETS[index]:
+            index += 1
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        if error:
+            self.errors += 1
+        if rows:
+            self.rows += rows
+        if nbytes:
+            self.bytes += nbytes
+
+    def percentile(self, pct: float) -> float:
+        """Estimate a percentile (seconds) as the upper bound of the bucket holding it"""
+        if not self.count:
+            return 0.0
+        rank = pct / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank and count:
+                return LATENCY_BUCKETS[index] if index < len(LATENCY_BUCKETS) else self.max
+        return self.max
+
+_histograms: Dict[str, Histogram] = {}
+_slow_queries = deque(maxlen=SLOW_QUERY_KEEP)
+_lock = threading.Lock()
+
+def observe(name: str, seconds: float, rows: Optional[int] = None, nbytes: Optional[int] = None,
+            error: bool = False):
+    """Record one call of name"""
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.observe(seconds, rows, nbytes, error)
+
+def timed(name: Optional[str] = None, rows: Optional[Callable] = None,
+          nbytes: Optional[Callable] = None) -> Callable:
+    """Decorator recording a function's calls, latency and errors.
+
+    Only Exceptions count as errors; control flow such as Streamlit's
+    rerun (a BaseException) propagates without being recorded.
+    rows and nbytes are optional functions of the return value giving the
+    rows returned or bytes produced, e.g. timed(rows=len).
+    """
+    def decorate(fn: Callable) -> Callable:
+        if not METRICS_ENABLED:
+            return fn
+        metric = name or f"{fn.__module__}.{fn.__qualname__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception:
+                observe(metric, time.perf_counter() - start, error=True)
+                raise
+            elapsed = time.perf_counter() - start
+            observe(metric, elapsed,
+                    rows(result) if rows is not None and result is not None else None,
+                    nbytes(result) if nbytes is not None and result is not None else None)
+            return result
+
+        return wrapper
+    return decorate
+
+class _Timing:
+    __slots__ = ('rows', 'bytes')
+
+    def __init__(self):
+        self.rows = None
+        self.bytes = None
+
+@contextmanager
+def timer(name: str):
+    """Time a with-block as name; set .rows or .bytes on the yielded object to record them"""
+    timing = _Timing()
+    if not METRICS_ENABLED:
+        yield timing
+        return
+    start = time.perf_counter()
+    try:
+        yield timing
+    except Exception:
+        observe(name, time.perf_counter() - start, error=True)
+        raise
+    observe(name, time.perf_counter() - start, timing.rows, timing.bytes)
+
+def _statement_kind(sql: str) -> str:
+    words = sql.split(None, 1)
+    return f"sql.{words[0].lower()}" if words else "sql"
+
+def _record_query(sql: str, seconds: float, rows: Optional[int] = None, error: bool = False):
+    observe(_statement_kind(sql), seconds, rows, error=error)
+    if seconds * 1000 < SLOW_QUERY_MS:
+        return
+    entry = {
+        'time': time.strftime("%Y-%m-%d %H:%M:%S"),
+        'ms': seconds * 1000,
+        'rows': rows,
+        'sql': " ".join(sql.split()),
+    }
+    with _lock:
+        _slow_queries.append(entry)
+    if SLOW_QUERY_LOG:
+        try:
+            with open(SLOW_QUERY_LOG, "a") as f:
+                f.write(f"{entry['time']}\t{entry['ms']:.1f} ms\t{entry['sql']}\n")
+        except OSError as e:
+            print(f"Error writing slow query log: {e}")
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor timing each statement, including the time spent in fetchall/fetchmany/fetchone"""
+
+    _sql = ""
+    _elapsed = 0.0
+    _rows = 0
+    _pending = False
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            super().execute(sql, parameters)
+        except Exception:
+            _record_query(sql, time.perf_counter() - start, error=True)
+            raise
+        elapsed = time.perf_counter() - start
+        if self.description is None:
+            # Statements returning nothing are complete
+            self._pending = False
+            _record_query(sql, elapsed, max(self.rowcount, 0))
+        else:
+            # Queries are recorded once their rows are fetched
+            self._sql, self._elapsed, self._rows, self._pending = sql, elapsed, 0, True
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            super().executemany(sql, seq_of_parameters)
+        except Exception:
+            _record_query(sql, time.perf_counter() - start, error=True)
+            raise
+        self._pending = False
+        _record_query(sql, time.perf_counter() - start, max(self.rowcount, 0))
+        return self
+
+    def _finish(self):
+        if self._pending:
+            self._pending = False
+            _record_query(self._sql, self._elapsed, self._rows)
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._elapsed += time.perf_counter() - start
+        self._rows += len(rows)
+        self._finish()
+        return rows
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._elapsed += time.perf_counter() - start
+        self._rows += len(rows)
+        if not rows:
+            self._finish()
+        return rows
+
+    def fetchone(self):
+        row = super().fetchone()
+        # Single-row lookups: the first step did the work
+        if row is not None:
+            self._rows += 1
+        self._finish()
+        return row
+
+    def __del__(self):
+        # Rows read by iterating the cursor are not timed one by one (that
+        # would tax every row); such statements are recorded, with their
+        # execute time only, once the cursor is released
+        self._finish()
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors (including conn.execute) are InstrumentedCursors"""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+def connection_factory():
+    """sqlite3.connect() factory: instrumented when metrics are enabled"""
+    return InstrumentedConnection if METRICS_ENABLED else sqlite3.Connection
+
+def snapshot() -> List[Dict]:
+    """Get per-name counters and latency estimates (ms), slowest total first"""
+    with _lock:
+        items = list(_histograms.items())
+        rows = []
+        for name, h in items:
+            rows.append({
+                'name': name,
+                'calls': h.count,
+                'errors': h.errors,
+                'total_ms': h.total * 1000,
+                'mean_ms': h.total / h.count * 1000 if h.count else 0.0,
+                'p50_ms': h.percentile(50) * 1000,
+                'p95_ms': h.percentile(95) * 1000,
+                'max_ms': h.max * 1000,
+                'rows': h.rows,
+                'bytes': h.bytes,
+            })
+    return sorted(rows, key=lambda row: -row['total_ms'])
+
+def slow_queries() -> List[Dict]:
+    """Get the most recent slow statements, newest first"""
+    with _lock:
+        return list(reversed(_slow_queries))
+
+def reset():
+    """Forget all recorded metrics and slow queries"""
+    with _lock:
+        _histograms.clear()
+        _slow_queries.clear()
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+def prometheus_text() -> str:
+    """Render the metrics in the Prometheus text exposition format"""
+    lines = [
+        "# HELP challan_call_duration_seconds Latency of instrumented calls and SQL statements.",
+        "# TYPE challan_call_duration_seconds histogram",
+    ]
+    with _lock:
+        items = sorted(_histograms.items())
+        for name, h in items:
+            label = _label(name)
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, h.buckets):
+                cumulative += count
+                lines.append(f'challan_call_duration_seconds_bucket{{name="{label}",le="{bound}"}} {cumulative}')
+            lines.append(f'challan_call_duration_seconds_bucket{{name="{label}",le="+Inf"}} {h.count}')
+            lines.append(f'challan_call_duration_seconds_sum{{name="{label}"}} {h.total:.6f}')
+            lines.append(f'challan_call_duration_seconds_count{{name="{label}"}} {h.count}')
+        for metric, attribute, help_text in (
+            ("challan_call_errors_total", "errors", "Instrumented calls that raised."),
+            ("challan_rows_total", "rows", "Rows returned or written by instrumented calls."),
+            ("challan_bytes_total", "bytes", "Bytes produced by instrumented calls."),
+        ):
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} counter")
+            for name, h in items:
+                lines.append(f'{metric}{{name="{_label(name)}"}} {getattr(h, attribute)}')
+    return "\n".join(lines) + "\n"
+
+def write_prometheus(path: str = METRICS_FILE) -> bool:
+    """Atomically write prometheus_text() to path"""
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write(prometheus_text())
+        os.replace(tmp_path, path)
+        return True
+    except OSError as e:
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        print(f"Error writing metrics file: {e}")
+        return False
+
+_writer: Optional[threading.Thread] = None
+_writer_lock = threading.Lock()
+
+def _write_periodically(path: str, interval: float):
+    while True:
+        write_prometheus(path)
+        time.sleep(interval)
+
+def start_metrics_writer():
+    """Start rewriting METRICS_FILE in the background (once per process; no-op without it)"""
+    global _writer
+    if not METRICS_ENABLED or not METRICS_FILE:
+        return
+    with _writer_lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_write_periodically, args=(METRICS_FILE, METRICS_FILE_INTERVAL),
+                                       name="metrics-writer", daemon=True)
+            _writer.start()
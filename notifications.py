@@ -0,0 +1,362 @@
+import os
+import smtplib
+import sqlite3
+import threading
+import time
+from email.mime.text import MIMEText
+from typing import Dict, Iterable, List, Optional, Tuple
+from db import connection, get_connection
+from query_cache import QueryCache, current_version
+
+# Delivery settings; with no CHALLAN_SMTP_HOST emails are queued but not sent.
+# For local testing point them at a debugging server, e.g.
+#   python -m aiosmtpd -n -l localhost:8025
+# with CHALLAN_SMTP_PORT=8025 and CHALLAN_SMTP_STARTTLS=0.
+SMTP_CONFIG = {
+    'smtp_server': os.environ.get("CHALLAN_SMTP_HOST", ""),
+    'smtp_port': int(os.environ.get("CHALLAN_SMTP_PORT", "587")),
+    'email': os.environ.get("CHALLAN_SMTP_FROM", os.environ.get("CHALLAN_SMTP_USER", "")),
+    'username': os.environ.get("CHALLAN_SMTP_USER", ""),
+    'password': os.environ.get("CHALLAN_SMTP_PASSWORD", ""),
+    'starttls': os.environ.get("CHALLAN_SMTP_STARTTLS", "1") == "1",
+}
+SMTP_TIMEOUT = 30.0
+# The SMTP session is closed after this long without anything to send
+SMTP_IDLE_TIMEOUT = 60.0
+
+# Student addresses are <roll number>@<domain>; status emails are off without it
+STUDENT_EMAIL_DOMAIN = os.environ.get("CHALLAN_STUDENT_EMAIL_DOMAIN", "")
+
+EMAIL_BATCH_SIZE = 50
+EMAIL_POLL_INTERVAL = 5.0
+EMAIL_MAX_ATTEMPTS = 5
+# Retry delay after the nth failure: EMAIL_RETRY_BASE * 2**(n-1), capped
+EMAIL_RETRY_BASE = 30.0
+EMAIL_RETRY_MAX = 3600.0
+# A claimed message not marked sent within this long is claimed again
+# (e.g. after a crash mid-send)
+EMAIL_LEASE_SECONDS = 300.0
+# Sent messages are deleted this many days after delivery (0 keeps them);
+# the dispatcher checks every EMAIL_PURGE_INTERVAL seconds
+EMAIL_RETENTION_DAYS = float(os.environ.get("CHALLAN_EMAIL_RETENTION_DAYS", "30"))
+EMAIL_PURGE_INTERVAL = 3600.0
+EMAIL_PURGE_BATCH = 5000
+# The outbox counts shown in the admin sidebar are reused for this long
+OUTBOX_COUNTS_TTL = 15.0
+
+_counts_cache = QueryCache(maxsize=1, ttl=OUTBOX_COUNTS_TTL)
+
+def queue_emails(messages: Iterable[Tuple[str, str, str]]) -> int:
+    """Add (to, subject, body) messages to the outbox; returns how many were queued"""
+    with connection() as conn:
+        cursor = conn.executemany(
+            "INSERT INTO email_outbox (to_email, subject, body) VALUES (?, ?, ?)", list(messages)
+        )
+        count = cursor.rowcount
+    if count:
+        get_email_dispatcher().wake()
+    return count
+
+def queue_email(to_email: str, subject: str, body: str) -> bool:
+    """Add one message to the outbox"""
+    try:
+        return queue_emails([(to_email, subject, body)]) == 1
+    except Exception as e:
+        print(f"Error queueing email: {e}")
+        return False
+
+def student_email(roll_number: str) -> Optional[str]:
+    """Get a student's address, or None when no student email domain is set"""
+    if not STUDENT_EMAIL_DOMAIN:
+        return None
+    return f"{roll_number.strip().lower()}@{STUDENT_EMAIL_DOMAIN}"
+
+def notify_status_change(challan_ids: List[int], status: str, comments: str = "") -> int:
+    """Queue a status email to each challan's student; returns how many were queued"""
+    if not STUDENT_EMAIL_DOMAIN or not challan_ids:
+        return 0
+
+    messages = []
+    with connection() as conn:
+        for start in range(0, len(challan_ids), 500):
+            chunk = challan_ids[start:start + 500]
+            rows = conn.execute(
+                f"SELECT id, student_name, roll_number, amount, reason FROM student_challans "
+                f"WHERE id IN ({', '.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            for row in rows:
+                body = (
+                    f"Dear {row['student_name']},\n\n"
+                    f"Your challan #{row['id']} ({row['reason']}, Rs. {row['amount']}) has been {status}."
+                )
+                if comments:
+                    body += f"\n\nComments: {comments}"
+                messages.append((student_email(row['roll_number']), f"Challan #{row['id']} {status}", body))
+
+    try:
+        return queue_emails(messages)
+    except Exception as e:
+        print(f"Error queueing status emails: {e}")
+        return 0
+
+def get_outbox_counts() -> Dict[str, int]:
+    """Get the number of outbox messages per status (queued, sending, sent, failed).
+
+    Counts are reused for up to OUTBOX_COUNTS_TTL seconds; any committed
+    write, the dispatcher's included, refreshes them sooner.
+    """
+    version = current_version()
+    hit, counts = _counts_cache.get('counts', version)
+    if not hit:
+        with connection() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS count FROM email_outbox GROUP BY status").fetchall()
+        counts = {row['status']: row['count'] for row in rows}
+        _counts_cache.set('counts', counts, version)
+    return dict(counts)
+
+class _PermanentFailure(Exception):
+    """The server rejected a message in a way retrying will not fix"""
+
+class EmailDispatcher:
+    """Background thread delivering the outbox over one reused SMTP session.
+
+    Due messages are claimed in batches, sent over a single authenticated
+    connection, and marked sent, scheduled for retry with exponential
+    backoff, or failed after EMAIL_MAX_ATTEMPTS.
+    """
+
+    def __init__(self, smtp_config: Optional[Dict] = None, batch_size: int = EMAIL_BATCH_SIZE,
+                 poll_interval: float = EMAIL_POLL_INTERVAL):
+        self.smtp_config = dict(SMTP_CONFIG, **(smtp_config or {}))
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._server: Optional[smtplib.SMTP] = None
+        self._last_used = 0.0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+
+    def start(self):
+        """Start the dispatcher thread if delivery is configured and it is not running"""
+        if not self.smtp_config['smtp_server']:
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="email-dispatcher", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stop the dispatcher thread and close its SMTP session"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def wake(self):
+        """Check the outbox now instead of at the next poll"""
+        self.start()
+        self._wake.set()
+
+    def _db(self) -> sqlite3.Connection:
+        # The outbox has its own connection so a batch never holds a pooled
+        # connection for long; its commits still invalidate the query cache
+        # (through data_version) like any other write
+        if self._conn is None:
+            self._conn = get_connection()
+        return self._conn
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                # Cleared before looking so a wake() during the batch is not lost
+                self._wake.clear()
+                try:
+                    claimed = self.dispatch_once()
+                except Exception as e:
+                    print(f"Error dispatching emails: {e}")
+                    claimed = 0
+                if time.monotonic() - self._last_purge > EMAIL_PURGE_INTERVAL:
+                    self._last_purge = time.monotonic()
+                    try:
+                        self.purge_sent()
+                    except Exception as e:
+                        print(f"Error purging sent emails: {e}")
+                if claimed < self.batch_size:
+                    if self._server is not None and time.monotonic() - self._last_used > SMTP_IDLE_TIMEOUT:
+                        self._close_session()
+                    self._wake.wait(self.poll_interval)
+        finally:
+            self._close_session()
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def dispatch_once(self) -> int:
+        """Claim and send one batch of due messages; returns how many were claimed"""
+        if not self.smtp_config['smtp_server']:
+            return 0
+        messages = self._claim()
+        if messages:
+            self._record(self._send(messages))
+        return len(messages)
+
+    def purge_sent(self) -> int:
+        """Delete messages sent over EMAIL_RETENTION_DAYS ago; returns how many were deleted"""
+        if EMAIL_RETENTION_DAYS <= 0:
+            return 0
+        conn = self._db()
+        deleted = 0
+        while True:
+            # Small batches, each committed, so the write lock is never held for long
+            try:
+                count = conn.execute("""
+                    DELETE FROM email_outbox WHERE id IN (
+                        SELECT id FROM email_outbox
+                        WHERE status = 'sent' AND sent_date < datetime('now', ?)
+                        LIMIT ?
+                    )
+                """, (f"-{EMAIL_RETENTION_DAYS} days", EMAIL_PURGE_BATCH)).rowcount
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            deleted += count
+            if count < EMAIL_PURGE_BATCH:
+                return deleted
+
+    def _claim(self) -> List[Dict]:
+        now = time.time()
+        conn = self._db()
+        # BEGIN IMMEDIATE so two processes never claim the same rows
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute("""
+                UPDATE email_outbox SET status = 'sending', next_attempt = ?
+                WHERE id IN (
+                    SELECT id FROM email_outbox
+                    WHERE status IN ('queued', 'sending') AND next_attempt <= ?
+                    ORDER BY next_attempt, id LIMIT ?
+                )
+                RETURNING id, to_email, subject, body, attempts
+            """, (now + EMAIL_LEASE_SECONDS, now, self.batch_size)).fetchall()
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return [dict(row) for row in rows]
+
+    def _session(self) -> smtplib.SMTP:
+        # The cached session is not pinged before each message; a connection
+        # the server dropped shows up when sending, and _deliver reconnects
+        if self._server is None:
+            config = self.smtp_config
+            server = smtplib.SMTP(config['smtp_server'], config['smtp_port'], timeout=SMTP_TIMEOUT)
+            try:
+                if config['starttls']:
+                    server.starttls()
+                if config['password']:
+                    server.login(config['username'] or config['email'], config['password'])
+            except Exception:
+                server.close()
+                raise
+            self._server = server
+        return self._server
+
+    def _close_session(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except (smtplib.SMTPException, OSError):
+                self._server.close()
+            self._server = None
+
+    def _send(self, messages: List[Dict]) -> List[Tuple[Dict, Optional[Exception], bool]]:
+        """Send messages; returns (message, error, permanent) for each"""
+        results = []
+        for index, message in enumerate(messages):
+            try:
+                error, permanent = self._deliver(message)
+            except (smtplib.SMTPException, OSError) as e:
+                # Cannot connect or log in: every remaining message is retried later
+                results.extend((m, e, False) for m in messages[index:])
+                break
+            results.append((message, error, permanent))
+            self._last_used = time.monotonic()
+        return results
+
+    def _deliver(self, message: Dict) -> Tuple[Optional[Exception], bool]:
+        """Send one message; returns (error, permanent). Connection and login errors are raised."""
+        reused = self._server is not None
+        server = self._session()
+        msg = MIMEText(message['body'], 'plain')
+        msg['From'] = self.smtp_config['email']
+        msg['To'] = message['to_email']
+        msg['Subject'] = message['subject']
+        try:
+            refused = server.sendmail(self.smtp_config['email'], [message['to_email']], msg.as_string())
+        except (smtplib.SMTPServerDisconnected, ConnectionError) as e:
+            self._close_session()
+            if not reused:
+                return e, False
+            # The server dropped the idle session: reconnect once and retry
+            return self._deliver(message)
+        except smtplib.SMTPRecipientsRefused as e:
+            return e, True
+        except smtplib.SMTPResponseException as e:
+            # 5xx replies are final; 4xx are temporary
+            return e, e.smtp_code >= 500
+        except (smtplib.SMTPException, OSError) as e:
+            self._close_session()
+            return e, False
+        if refused:
+            return _PermanentFailure(str(refused)), True
+        return None, False
+
+    def _record(self, results: List[Tuple[Dict, Optional[Exception], bool]]):
+        sent, retry, failed = [], [], []
+        now = time.time()
+        for message, error, permanent in results:
+            attempts = message['attempts'] + 1
+            if error is None:
+                sent.append((attempts, message['id']))
+            elif permanent or attempts >= EMAIL_MAX_ATTEMPTS:
+                failed.append((attempts, str(error), message['id']))
+            else:
+                delay = min(EMAIL_RETRY_BASE * 2 ** (attempts - 1), EMAIL_RETRY_MAX)
+                retry.append((attempts, now + delay, str(error), message['id']))
+
+        conn = self._db()
+        try:
+            conn.executemany("""
+                UPDATE email_outbox SET status = 'sent', attempts = ?, last_error = NULL,
+                    sent_date = CURRENT_TIMESTAMP
+                WHERE id = ?
+            """, sent)
+            conn.executemany("""
+                UPDATE email_outbox SET status = 'queued', attempts = ?, next_attempt = ?, last_error = ?
+                WHERE id = ?
+            """, retry)
+            conn.executemany("""
+                UPDATE email_outbox SET status = 'failed', attempts = ?, last_error = ?
+                WHERE id = ?
+            """, failed)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+_dispatcher: Optional[EmailDispatcher] = None
+_dispatcher_lock = threading.Lock()
+
+def get_email_dispatcher() -> EmailDispatcher:
+    """Get the process-wide email dispatcher"""
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = EmailDispatcher()
+    return _dispatcher
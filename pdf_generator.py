@@ -1,145 +1,263 @@
-
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4
 from datetime import datetime, timedelta
+from functools import lru_cache
 import io
-from typing import Dict
+from typing import Dict, Iterable, Iterator, List, Union
+from metrics import timed
 
-def generate_challan_pdf(challan_data: Dict) -> bytes:
-    """Generate PDF challan with 4 copies in 1x4 grid layout (single column, 4 rows)"""
-    pdf_buffer = io.BytesIO()
-    c = canvas.Canvas(pdf_buffer, pagesize=A4)
+# Define copy types
+COPY_TYPES = ["Bank Copy", "Accounts Copy", "Department Copy", "Student Copy"]
+
+# Updated Bank details section
+BANK_DETAILS = [
+    "Account No: 00250025026967210000",
+    "First Women Bank",
+    "Account Title:",
+    "DEPARTMENT OF",
+    "ARTIFICIAL",
+    "INTELLIGENCE"
+]
+
+# Name of the form XObject holding everything that is identical on every challan
+TEMPLATE_FORM = "ChallanTemplate"
+
+@lru_cache(maxsize=1)
+def _copy_positions() -> List[Dict]:
+    """Compute the anchor coordinates of each copy panel (1x4 grid, one column, four rows)"""
     page_w, page_h = A4
-    
-    # Calculate current date and challan number
-    current_date = datetime.now().strftime('%d-%m-%Y %I:%M:%S %p')
-    challan_number = "2517381134"
-    valid_till = (datetime.now() + timedelta(days=3)).strftime('%d/%m/%Y')
-    
-    # Define copy types
-    copy_types = ["Bank Copy", "Accounts Copy", "Department Copy", "Student Copy"]
-    
+
     # Page dimensions and margins
     margin = 20
     copy_width = page_w - (2 * margin)
     copy_height = (page_h - (2 * margin)) / 4 - 10  # 10pt gap between copies
-    
-    # Generate 4 copies (1x4 grid - one column, four rows)
-    for i, copy_type in enumerate(copy_types):
+
+    positions = []
+    for i, copy_type in enumerate(COPY_TYPES):
         # Calculate position for each copy
         x = margin
         y = page_h - margin - (i * (copy_height + 10)) - copy_height
-        
+
+        # Walk down the panel exactly as the layout is drawn
+        title_y = y + copy_height - 15
+        university_y = title_y - 20
+        bank_y = university_y - 12 - 30
+        separator_y = bank_y - 8 * len(BANK_DETAILS) - 10
+        date_y = separator_y - 15
+        number_y = date_y - 12
+        valid_y = number_y - 15
+        details_y = valid_y - 20
+        table_y = details_y - 10 * 4 - 10
+        header_y = table_y - 10
+        content_y = header_y - 22
+        total_y = content_y - 12
+
+        positions.append({
+            'copy_type': copy_type,
+            'x': x,
+            'y': y,
+            'width': copy_width,
+            'height': copy_height,
+            'title_y': title_y,
+            'university_y': university_y,
+            'bank_y': bank_y,
+            'separator_y': separator_y,
+            'date_y': date_y,
+            'number_y': number_y,
+            'valid_y': valid_y,
+            'details_y': details_y,
+            'table_y': table_y,
+            'header_y': header_y,
+            'content_y': content_y,
+            'total_y': total_y,
+        })
+    return positions
+
+def _draw_template(c: canvas.Canvas):
+    """Draw the static parts of all four copies: borders, headers, bank details and table frames"""
+    for p in _copy_positions():
+        x, copy_width = p['x'], p['width']
+
         # Draw copy border
-        c.rect(x, y, copy_width, copy_height)
-        
-        # Current Y position for content (start from top of the copy)
-        current_y = y + copy_height - 15
-        
+        c.rect(x, p['y'], copy_width, p['height'])
+
         # Header section - Copy type
         c.setFont('Helvetica-Bold', 12)
-        c.drawCentredString(x + copy_width/2, current_y, copy_type)
-        c.line(x + 10, current_y - 5, x + copy_width - 10, current_y - 5)
-        current_y -= 20
-        
+        c.drawCentredString(x + copy_width/2, p['title_y'], p['copy_type'])
+        c.line(x + 10, p['title_y'] - 5, x + copy_width - 10, p['title_y'] - 5)
+
         # University header
         c.setFont('Helvetica-Bold', 10)
-        c.drawString(x + 10, current_y - 12, 'The Islamia University of Bahawalpur')
-        current_y -= 12
-        
+        c.drawString(x + 10, p['university_y'] - 12, 'The Islamia University of Bahawalpur')
+
         c.setFont('Helvetica', 8)
-        c.drawString(x + 10, current_y, 'F.T.N: 9020017-1')
-        current_y -= 30
-        
-        # Updated Bank details section
+        c.drawString(x + 10, p['university_y'] - 12, 'F.T.N: 9020017-1')
+
         c.setFont('Helvetica', 7)
-        bank_details = [
-            "Account No: 00250025026967210000",
-            "First Women Bank",
-            "Account Title:",
-            "DEPARTMENT OF",
-            "ARTIFICIAL",
-            "INTELLIGENCE"
-        ]
-        
-        for detail in bank_details:
+        current_y = p['bank_y']
+        for detail in BANK_DETAILS:
             c.drawString(x + 10, current_y, detail)
             current_y -= 8
-        
-        current_y -= 10
-        
+
         # Separator line
-        c.line(x + 10, current_y, x + copy_width - 10, current_y)
-        current_y -= 15
-        
-        # Date and challan info
-        c.setFont('Helvetica', 8)
-        c.drawCentredString(x + copy_width/2, current_y, current_date)
-        current_y -= 12
-        
-        c.setFont('Helvetica-Bold', 9)
-        c.drawCentredString(x + copy_width/2, current_y, f"Challan No: {challan_number}")
-        current_y -= 15
-        
-        # Valid till
-        c.setFont('Helvetica-Bold', 8)
-        c.drawCentredString(x + copy_width/2, current_y, f"Challan Valid Till: {valid_till}")
-        current_y -= 20
-        
-        # Student details
-        c.setFont('Helvetica', 8)
-        student_details = [
-            f"Name: {challan_data['student_name']}",
-            f"CNIC / Other: {challan_data['id_card_number']}",
-            f"App #: {challan_data['roll_number']}",
-            f"App Title: {challan_data['reason']}"
-        ]
-        
-        for detail in student_details:
-            c.drawString(x + 10, current_y, detail)
-            current_y -= 10
-        
-        current_y -= 10
-        
+        c.line(x + 10, p['separator_y'], x + copy_width - 10, p['separator_y'])
+
         # Amount table
-        table_y = current_y
-        table_height = 40
-        
+        table_y, table_height = p['table_y'], 40
+
         # Table border
         c.rect(x + 10, table_y - table_height, copy_width - 20, table_height)
-        
+
         # Table headers with background
-        header_y = table_y - 10
+        header_y = p['header_y']
         c.setFillColorRGB(0.9, 0.9, 0.9)  # Light gray background
         c.rect(x + 10, header_y, copy_width - 20, -12, fill=1, stroke=1)
         c.setFillColorRGB(0, 0, 0)  # Reset to black
-        
+
         # Vertical line for table columns
         c.line(x + copy_width - 80, table_y - table_height, x + copy_width - 80, table_y)
-        
+
         # Header text
         c.setFont('Helvetica-Bold', 8)
         c.drawString(x + 15, header_y - 8, 'Particular')
         c.drawString(x + copy_width - 75, header_y - 8, 'Amount (Rs)')
-        
-        # Table content
-        content_y = header_y - 22
-        c.setFont('Helvetica', 8)
-        c.drawString(x + 15, content_y, challan_data['reason'])
-        c.drawString(x + copy_width - 75, content_y, f"Rs. {challan_data['amount']}/-")
-        
+
         # Total row with dark background
-        total_y = content_y - 12
+        total_y = p['total_y']
         c.setFillColorRGB(0, 0, 0)  # Black background
         c.rect(x + 10, total_y, copy_width - 20, -12, fill=1, stroke=1)
         c.setFillColorRGB(1, 1, 1)  # White text
         c.setFont('Helvetica-Bold', 8)
         c.drawString(x + 15, total_y - 8, 'Total Amount to Pay')
-        c.drawString(x + copy_width - 75, total_y - 8, f"Rs. {challan_data['amount']}/-")
         c.setFillColorRGB(0, 0, 0)  # Reset to black
-    
-    c.showPage()
-    c.save()
-    pdf_buffer.seek(0)
-    
-    return pdf_buffer.getvalue()
+
+def _format_date(value, parse_format: str, display_format: str, default: datetime) -> str:
+    try:
+        return datetime.strptime(str(value), parse_format).strftime(display_format)
+    except ValueError:
+        return default.strftime(display_format)
+
+def _challan_fields(challan_data: Dict) -> Dict:
+    """Format the per-challan text printed on every copy"""
+    # Dates come from the challan itself so the same challan always renders
+    # the same document; fall back to now for records without them
+    now = datetime.now()
+    created = challan_data.get('created_date') or ''
+    valid_till = challan_data.get('valid_till') or ''
+    # Unsaved challans have no number yet
+    challan_number = challan_data.get('challan_number') or "-"
+    amount = f"Rs. {challan_data['amount']}/-"
+    return {
+        'current_date': _format_date(created, '%Y-%m-%d %H:%M:%S', '%d-%m-%Y %I:%M:%S %p', now),
+        'challan_number': f"Challan No: {challan_number}",
+        'valid_till': "Challan Valid Till: " + _format_date(
+            valid_till, '%Y-%m-%d', '%d/%m/%Y', now + timedelta(days=3)),
+        'student_details': [
+            f"Name: {challan_data['student_name']}",
+            f"CNIC / Other: {challan_data['id_card_number']}",
+            f"App #: {challan_data['roll_number']}",
+            f"App Title: {challan_data['reason']}"
+        ],
+        'reason': str(challan_data['reason']),
+        'amount': amount,
+    }
+
+def _draw_fields(c: canvas.Canvas, fields: Dict):
+    """Overlay one challan's details onto the template"""
+    for p in _copy_positions():
+        x, copy_width = p['x'], p['width']
+        center = x + copy_width/2
+
+        # Date and challan info
+        c.setFont('Helvetica', 8)
+        c.drawCentredString(center, p['date_y'], fields['current_date'])
+
+        c.setFont('Helvetica-Bold', 9)
+        c.drawCentredString(center, p['number_y'], fields['challan_number'])
+
+        # Valid till
+        c.setFont('Helvetica-Bold', 8)
+        c.drawCentredString(center, p['valid_y'], fields['valid_till'])
+
+        # Student details
+        c.setFont('Helvetica', 8)
+        current_y = p['details_y']
+        for detail in fields['student_details']:
+            c.drawString(x + 10, current_y, detail)
+            current_y -= 10
+
+        # Table content
+        c.drawString(x + 15, p['content_y'], fields['reason'])
+        c.drawString(x + copy_width - 75, p['content_y'], fields['amount'])
+
+        # Amount in the total row
+        c.setFillColorRGB(1, 1, 1)  # White text
+        c.setFont('Helvetica-Bold', 8)
+        c.drawString(x + copy_width - 75, p['total_y'] - 8, fields['amount'])
+        c.setFillColorRGB(0, 0, 0)  # Reset to black
+
+def _begin_document(c: canvas.Canvas):
+    """Define the template form on a fresh canvas"""
+    c.beginForm(TEMPLATE_FORM)
+    _draw_template(c)
+    c.endForm()
+
+class ChallanRenderer:
+    """Render challans page by page onto one canvas.
+
+    With shared_template the static layout is defined once per document as
+    a form XObject that every page references, so a merged batch of N
+    challans draws and carries the template once instead of N times. A
+    single-page document gains nothing from the form, so it can draw the
+    template straight onto its page instead.
+    """
+
+    def __init__(self, shared_template: bool = True):
+        self.buffer = io.BytesIO()
+        self.canvas = canvas.Canvas(self.buffer, pagesize=A4)
+        self.shared_template = shared_template
+        self.pages = 0
+        if shared_template:
+            _begin_document(self.canvas)
+
+    def add(self, challan_data: Dict):
+        """Append a page for one challan"""
+        if self.shared_template:
+            self.canvas.doForm(TEMPLATE_FORM)
+        else:
+            _draw_template(self.canvas)
+        _draw_fields(self.canvas, _challan_fields(challan_data))
+        self.canvas.showPage()
+        self.pages += 1
+
+    def finish(self) -> bytes:
+        """Close the document and return its bytes"""
+        self.canvas.save()
+        return self.buffer.getvalue()
+
+@timed(nbytes=len)
+def generate_challan_pdf(challan_data: Dict) -> bytes:
+    """Generate PDF challan with 4 copies in 1x4 grid layout (single column, 4 rows)"""
+    renderer = ChallanRenderer(shared_template=False)
+    renderer.add(challan_data)
+    return renderer.finish()
+
+def iter_challan_pdfs(challans: Iterable[Dict]) -> Iterator[bytes]:
+    """Generate one PDF per challan, lazily"""
+    for challan_data in challans:
+        yield generate_challan_pdf(challan_data)
+
+def generate_challan_pdfs(challans: Iterable[Dict], merged: bool = False) -> Union[bytes, List[bytes]]:
+    """Generate PDFs for many challans.
+
+    With merged=True all challans go into one document (one page each)
+    sharing a single template XObject; otherwise a list with one PDF per
+    challan is returned.
+    """
+    if not merged:
+        return list(iter_challan_pdfs(challans))
+
+    renderer = ChallanRenderer()
+    for challan_data in challans:
+        renderer.add(challan_data)
+    return renderer.finish()
@@ -0,0 +1,140 @@
+import glob
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from typing import Dict, Iterable, Optional
+
+PDF_DIR = os.environ.get("CHALLAN_PDF_DIR", "pdfs")
+PDF_CACHE_MAX_BYTES = int(os.environ.get("CHALLAN_PDF_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Everything that can change what the PDF shows, plus status so that a
+# status change also retires the cached copy
+PDF_KEY_FIELDS = (
+    'id', 'student_name', 'roll_number', 'id_card_number', 'semester',
+    'amount', 'reason', 'created_date', 'valid_till', 'status', 'challan_number'
+)
+
+_lock = threading.Lock()
+_total_bytes = None
+
+def content_key(challan: Dict) -> str:
+    """Hash of the challan fields that determine its PDF"""
+    fields = {field: challan.get(field) for field in PDF_KEY_FIELDS}
+    payload = json.dumps(fields, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(payload).hexdigest()
+
+def _pdf_path(challan_id, key: str) -> str:
+    return os.path.join(PDF_DIR, f"challan_{challan_id}_{key[:32]}.pdf")
+
+def _entries_for(challan_id) -> list:
+    return glob.glob(os.path.join(PDF_DIR, f"challan_{challan_id}_*.pdf"))
+
+def _remove(path: str):
+    global _total_bytes
+    try:
+        size = os.path.getsize(path)
+        os.remove(path)
+    except OSError:
+        return
+    if _total_bytes is not None:
+        _total_bytes -= size
+
+def get_cached_pdf(challan: Dict) -> Optional[bytes]:
+    """Get a challan's cached PDF bytes, or None on a miss"""
+    path = _pdf_path(challan['id'], content_key(challan))
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        # Mark as recently used for LRU eviction
+        os.utime(path)
+        return data
+    except OSError:
+        return None
+
+def get_challan_pdf(challan: Dict) -> bytes:
+    """Get a challan's PDF from the on-disk cache, rendering and storing it on a miss"""
+    # Imported here: db uses this module for invalidation, and processes
+    # that never render (the API, CLIs, migrations) shouldn't load reportlab
+    from pdf_generator import generate_challan_pdf
+
+    if challan.get('id') is None:
+        # Nothing stable to key on
+        return generate_challan_pdf(challan)
+
+    data = get_cached_pdf(challan)
+    if data is None:
+        data = generate_challan_pdf(challan)
+        store_challan_pdf(challan, data)
+    return data
+
+def store_challan_pdf(challan: Dict, data: bytes):
+    """Store rendered PDF bytes for a challan, replacing older versions of it"""
+    global _total_bytes
+    challan_id = challan['id']
+    path = _pdf_path(challan_id, content_key(challan))
+    try:
+        os.makedirs(PDF_DIR, exist_ok=True)
+        # Write to a temp file and rename so readers never see a partial PDF
+        fd, tmp_path = tempfile.mkstemp(dir=PDF_DIR, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Error caching challan PDF: {e}")
+        return
+
+    with _lock:
+        # Older renders of this challan (different fields or status) are stale
+        for stale in _entries_for(challan_id):
+            if stale != path:
+                _remove(stale)
+        if _total_bytes is None:
+            _total_bytes = _scan_size()
+        else:
+            _total_bytes += len(data)
+        if _total_bytes > PDF_CACHE_MAX_BYTES:
+            _evict(PDF_CACHE_MAX_BYTES)
+
+def invalidate_challan_pdfs(challan_ids: Iterable[int]):
+    """Drop cached PDFs for the given challans"""
+    challan_ids = {str(challan_id) for challan_id in challan_ids}
+    if not challan_ids:
+        return
+    with _lock:
+        if len(challan_ids) == 1:
+            paths = _entries_for(next(iter(challan_ids)))
+        else:
+            # One directory scan for a bulk update instead of a glob per challan
+            paths = [path for path in glob.glob(os.path.join(PDF_DIR, "challan_*.pdf"))
+                     if os.path.basename(path).split("_")[1] in challan_ids]
+        for path in paths:
+            _remove(path)
+
+def _scan_size() -> int:
+    return sum(os.path.getsize(p) for p in glob.glob(os.path.join(PDF_DIR, "challan_*.pdf")))
+
+def _evict(max_bytes: int):
+    """Delete least recently used PDFs until the cache fits in max_bytes"""
+    global _total_bytes
+    entries = []
+    for path in glob.glob(os.path.join(PDF_DIR, "challan_*.pdf")):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    # Evict down to 90% so the next few writes don't trigger another scan
+    target = int(max_bytes * 0.9)
+    for _, size, path in sorted(entries):
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+    _total_bytes = total
@@ -0,0 +1,65 @@
+from typing import Dict, Optional, Sequence
+import numpy as np
+import pandas as pd
+from utils import CHALLAN_STATUSES
+from metrics import timed
+
+# Status labels shown to students
+STATUS_LABELS = {
+    'pending': '🟡 Pending',
+    'paid': '🟢 Paid',
+    'approved': '✅ Approved',
+    'rejected': '❌ Rejected'
+}
+
+def format_amounts(amounts: pd.Series) -> pd.Series:
+    """Format rupee amounts as 'Rs. 1,234'.
+
+    Fines take few distinct values, so each distinct amount is formatted
+    once and the labels are gathered by position.
+    """
+    codes, uniques = pd.factorize(amounts, use_na_sentinel=True)
+    labels = np.array([f"Rs. {int(x):,}" for x in uniques] + [""], dtype=object)
+    # The NA sentinel -1 picks the trailing empty label
+    return pd.Series(labels[codes], index=amounts.index)
+
+def format_dates(dates: pd.Series) -> pd.Series:
+    """Shorten stored 'YYYY-MM-DD HH:MM:SS' timestamps to 'YYYY-MM-DD HH:MM'"""
+    # The stored format is fixed, so slicing replaces parsing and reformatting
+    return dates.astype("string").str.slice(0, 16)
+
+def status_column(statuses: pd.Series, labels: Optional[Dict[str, str]] = None) -> pd.Series:
+    """Convert statuses to a categorical column, optionally relabelled"""
+    known = list(CHALLAN_STATUSES)
+    extra = sorted(set(statuses.dropna().unique()) - set(known))
+    column = pd.Series(pd.Categorical(statuses, categories=known + extra), index=statuses.index)
+    if labels:
+        column = column.cat.rename_categories([labels.get(c, c) for c in column.cat.categories])
+    return column
+
+@timed(rows=len)
+def challan_frame(rows, columns: Optional[Sequence[str]] = None,
+                  status_labels: Optional[Dict[str, str]] = None) -> pd.DataFrame:
+    """Build a display DataFrame of challans with amounts, dates and statuses formatted.
+
+    rows may be dicts (as returned by the db query functions), tuples in
+    the order of columns (as fetched from a cursor), or a pyarrow Table.
+    """
+    if hasattr(rows, 'to_pandas'):
+        df = rows.to_pandas()
+        if columns is not None:
+            df = df[list(columns)]
+    elif rows and isinstance(rows[0], dict):
+        columns = list(columns or rows[0].keys())
+        # Column lists of just the needed fields beat DataFrame(list of dicts)
+        df = pd.DataFrame({c: [row[c] for row in rows] for c in columns})
+    else:
+        df = pd.DataFrame.from_records(rows, columns=columns)
+
+    if 'amount' in df:
+        df['amount'] = format_amounts(df['amount'])
+    if 'created_date' in df:
+        df['created_date'] = format_dates(df['created_date'])
+    if 'status' in df:
+        df['status'] = status_column(df['status'], status_labels)
+    return df
@@ -0,0 +1,133 @@
+import functools
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# Results older than this are refetched even without a write
+DEFAULT_TTL = 60.0
+DEFAULT_MAXSIZE = 512
+
+_version = 0
+_version_lock = threading.Lock()
+# Optional counter that also changes on writes made outside this process
+_version_source: Optional[Callable[[], int]] = None
+
+def bump_version():
+    """Invalidate every cached read (called after each committed write)"""
+    global _version
+    with _version_lock:
+        _version += 1
+
+def set_version_source(source: Optional[Callable[[], int]]):
+    """Fold an external change counter (e.g. SQLite's data_version) into the table version"""
+    global _version_source
+    _version_source = source
+
+def current_version():
+    """Get the current table version"""
+    source = _version_source
+    if source is None:
+        return _version
+    return _version, source()
+
+class QueryCache:
+    """Thread-safe LRU cache with TTL whose entries are tagged with a table version"""
+
+    def __init__(self, maxsize: int = DEFAULT_MAXSIZE, ttl: float = DEFAULT_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Any, Tuple[int, float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, version) -> Tuple[bool, Any]:
+        """Look up a key; returns (hit, value)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry_version, stored_at, value = entry
+                if entry_version == version and time.monotonic() - stored_at < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def set(self, key, value, version):
+        """Store a value computed at the given table version"""
+        with self._lock:
+            self._entries[key] = (version, time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop all entries and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> Dict:
+        """Get hit/miss counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+_cache = QueryCache()
+
+def _freeze(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    return value
+
+def _copy(value):
+    # Hand out fresh containers so callers can't reorder or extend the cached
+    # result; the row dicts themselves are shared and must be treated as read-only.
+    if isinstance(value, list):
+        return list(value)
+    if isinstance(value, dict):
+        return dict(value)
+    return value
+
+def cached_query(fn: Callable) -> Callable:
+    """Cache a read function's result per arguments until the next write"""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        key = (fn.__name__, _freeze(args), _freeze(kwargs))
+        try:
+            hash(key)
+        except TypeError:
+            return fn(*args, **kwargs)
+
+        # Read the version before querying: a write that lands mid-query
+        # leaves this entry tagged stale
+        version = current_version()
+        hit, value = _cache.get(key, version)
+        if not hit:
+            value = fn(*args, **kwargs)
+            _cache.set(key, value, version)
+        return _copy(value)
+
+    wrapper.uncached = fn
+    return wrapper
+
+def get_cache_stats() -> Dict:
+    """Get hit/miss counters for the shared query cache"""
+    return _cache.stats()
+
+def clear_cache():
+    """Empty the shared query cache"""
+    _cache.clear()
@@ -0,0 +1,183 @@
+import hashlib
+import os
+import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import BinaryIO, Dict, Optional, Tuple
+
+RECEIPT_DIR = os.environ.get("CHALLAN_RECEIPT_DIR", os.path.join("uploads", "receipts"))
+RECEIPT_MAX_BYTES = int(os.environ.get("CHALLAN_RECEIPT_MAX_BYTES", str(10 * 1024 * 1024)))
+RECEIPT_EXTENSIONS = ('pdf', 'jpg', 'jpeg', 'png')
+RECEIPT_CHUNK_SIZE = 1024 * 1024
+
+# Downscaled copies for admin review: (longest side in px, quality)
+PREVIEW_SIZES = {
+    'review': (1600, 80),
+    'thumb': (240, 70),
+}
+PREVIEW_WORKERS = int(os.environ.get("CHALLAN_PREVIEW_WORKERS", "2"))
+# Resolution the first page of a PDF receipt is rasterized at
+PDF_PREVIEW_DPI = 110
+
+class ReceiptRejected(Exception):
+    """Raised when an uploaded receipt is too large or of an unsupported type"""
+
+def receipt_path(receipt_hash: str, extension: str) -> str:
+    """Path of a stored receipt: two levels of hash-prefix directories keep each one small"""
+    return os.path.join(RECEIPT_DIR, receipt_hash[:2], receipt_hash[2:4], f"{receipt_hash}.{extension}")
+
+def _extension(filename: str) -> str:
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension not in RECEIPT_EXTENSIONS:
+        raise ReceiptRejected(f"Receipts must be one of: {', '.join(RECEIPT_EXTENSIONS)}")
+    # One spelling per format so identical files always share a path
+    return 'jpg' if extension == 'jpeg' else extension
+
+def store_receipt(source: BinaryIO, filename: str, max_bytes: int = RECEIPT_MAX_BYTES) -> Tuple[str, str]:
+    """Stream an uploaded receipt into content-addressed storage.
+
+    The file is copied in chunks to a temporary file while being hashed
+    and measured, so it is never held in memory twice and oversized
+    uploads are abandoned early. A receipt whose content is already stored
+    is not written again. Returns (path, sha256 hex digest); raises
+    ReceiptRejected for unsupported or oversized files.
+    """
+    extension = _extension(filename)
+    os.makedirs(RECEIPT_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+
+    # The temp file lives under RECEIPT_DIR so the final rename stays on one filesystem
+    fd, tmp_path = tempfile.mkstemp(dir=RECEIPT_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while True:
+                chunk = source.read(RECEIPT_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ReceiptRejected(f"Receipts must be at most {round(max_bytes / (1024 * 1024), 1):g} MB")
+                digest.update(chunk)
+                f.write(chunk)
+        if size == 0:
+            raise ReceiptRejected("The receipt file is empty")
+
+        receipt_hash = digest.hexdigest()
+        path = receipt_path(receipt_hash, extension)
+        if os.path.exists(path):
+            # Same content uploaded before (e.g. a re-upload); keep the stored copy
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+        return path, receipt_hash
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def preview_path(receipt_hash: str, kind: str) -> str:
+    """Path of a receipt's 'review' or 'thumb' image, next to the receipt"""
+    return os.path.join(RECEIPT_DIR, receipt_hash[:2], receipt_hash[2:4], f"{receipt_hash}.{kind}.{_preview_ext()}")
+
+def _preview_ext() -> str:
+    from PIL import features
+
+    return 'webp' if features.check('webp') else 'jpg'
+
+def _open_image(path: str, longest: int):
+    from PIL import Image, ImageOps
+
+    if path.lower().endswith('.pdf'):
+        return _rasterize_pdf(path)
+    image = Image.open(path)
+    # Let the JPEG decoder scale by 1/2, 1/4 or 1/8 while decoding, which
+    # is far cheaper than decoding a full phone photo and resizing it
+    image.draft('RGB', (longest, longest))
+    # Phone photos are often stored sideways with an EXIF rotation tag
+    return ImageOps.exif_transpose(image)
+
+def _rasterize_pdf(path: str):
+    # PyMuPDF is optional: without it PDF receipts get no preview
+    try:
+        import pymupdf
+    except ImportError:
+        return None
+    from PIL import Image
+
+    with pymupdf.open(path) as document:
+        if document.page_count == 0:
+            return None
+        pixmap = document[0].get_pixmap(dpi=PDF_PREVIEW_DPI)
+        return Image.frombytes("RGB", (pixmap.width, pixmap.height), pixmap.samples)
+
+def generate_previews(path: str, receipt_hash: str) -> bool:
+    """Write the review and thumbnail images of a stored receipt; returns False if it has none"""
+    largest = max(size for size, _ in PREVIEW_SIZES.values())
+    image = _open_image(path, largest)
+    if image is None:
+        return False
+    image = image.convert('RGB')
+    fmt = 'WEBP' if _preview_ext() == 'webp' else 'JPEG'
+
+    # Largest first, each copy shrunk from the previous one
+    for kind, (size, quality) in sorted(PREVIEW_SIZES.items(), key=lambda item: -item[1][0]):
+        image.thumbnail((size, size))
+        target = preview_path(receipt_hash, kind)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                image.save(f, fmt, quality=quality)
+            os.replace(tmp_path, target)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+    return True
+
+_preview_pool: Optional[ThreadPoolExecutor] = None
+_preview_jobs: Dict[str, Future] = {}
+# Receipts that cannot be previewed (e.g. PDFs without PyMuPDF), so
+# they are not retried on every page view
+_no_preview = set()
+_preview_lock = threading.Lock()
+
+def _generate_logged(path: str, receipt_hash: str) -> bool:
+    try:
+        created = generate_previews(path, receipt_hash)
+    except Exception as e:
+        print(f"Error generating receipt preview: {e}")
+        created = False
+    with _preview_lock:
+        _preview_jobs.pop(receipt_hash, None)
+        if not created:
+            _no_preview.add(receipt_hash)
+    return created
+
+def schedule_previews(path: str, receipt_hash: str) -> Future:
+    """Generate a receipt's previews on the background pool (once per hash at a time)"""
+    global _preview_pool
+    with _preview_lock:
+        job = _preview_jobs.get(receipt_hash)
+        if job is None:
+            if _preview_pool is None:
+                # Pillow releases the GIL while decoding and resizing
+                _preview_pool = ThreadPoolExecutor(max_workers=PREVIEW_WORKERS, thread_name_prefix="receipt-preview")
+            job = _preview_pool.submit(_generate_logged, path, receipt_hash)
+            _preview_jobs[receipt_hash] = job
+        return job
+
+def get_preview(receipt_path: Optional[str], receipt_hash: Optional[str], kind: str = 'thumb') -> Optional[str]:
+    """Get the path of a receipt's preview image.
+
+    Returns None while it is missing, scheduling its generation (e.g. for
+    receipts stored before previews existed) so a later call finds it.
+    """
+    if not receipt_path or not receipt_hash or receipt_hash in _no_preview:
+        return None
+    path = preview_path(receipt_hash, kind)
+    if os.path.exists(path):
+        return path
+    if os.path.exists(receipt_path):
+        schedule_previews(receipt_path, receipt_hash)
+    return None
@@ -0,0 +1,301 @@
+import argparse
+import csv
+import io
+import json
+import os
+import re
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Iterator, List, Optional, Tuple
+from db import connection, bulk_update_challan_status, is_valid_challan_number
+from metrics import timed
+from notifications import notify_status_change
+
+# Statement columns are matched case-insensitively under any of these names
+STATEMENT_COLUMNS = {
+    'reference': ('challan_number', 'challan_no', 'challan', 'reference', 'ref', 'ref_no'),
+    'roll_number': ('roll_number', 'roll_no', 'roll'),
+    'amount': ('amount', 'credit', 'credit_amount', 'deposit'),
+    'transaction_id': ('transaction_id', 'txn_id', 'tran_id', 'transaction_ref'),
+    'date': ('date', 'value_date', 'transaction_date', 'posting_date'),
+    'description': ('description', 'narration', 'particulars', 'details'),
+}
+# Challans a payment can settle; the rest are reported instead of changed
+OPEN_STATUSES = ('pending', 'paid')
+RECONCILED_STATUS = 'approved'
+# Roll numbers quoted in a free-text narration, e.g. "fee 2021-CS-0001"
+ROLL_PATTERN = re.compile(r"\b\d{4}-[A-Za-z]{2,6}-\d{1,5}\b")
+# Amounts as statements print them, e.g. "1,200.00"
+AMOUNT_PATTERN = re.compile(r"-?\d[\d,]*(?:\.\d+)?")
+LOOKUP_CHUNK_SIZE = 5000
+
+REPORT_FIELDS = ('line', 'transaction_id', 'date', 'reference', 'roll_number', 'amount', 'challan_id', 'challan_number',
+                 'reason')
+
+def _column_map(fieldnames: List[str]) -> Dict[str, str]:
+    normalized = {re.sub(r"[\s.]+", "_", name.strip().lower()): name for name in fieldnames}
+    mapping = {}
+    for field, aliases in STATEMENT_COLUMNS.items():
+        for alias in aliases:
+            if alias in normalized:
+                mapping[field] = normalized[alias]
+                break
+    return mapping
+
+def iter_statement_rows(source) -> Iterator[Tuple[int, Dict]]:
+    """Stream (line number, row) pairs from a statement CSV path or binary file, with canonical keys"""
+    if isinstance(source, (str, os.PathLike)):
+        f = open(source, newline="", encoding="utf-8-sig")
+    else:
+        f = io.TextIOWrapper(source, newline="", encoding="utf-8-sig")
+    with f:
+        reader = csv.DictReader(f)
+        mapping = _column_map(reader.fieldnames or [])
+        if 'amount' not in mapping or not ({'reference', 'roll_number', 'description'} & mapping.keys()):
+            raise ValueError("Statements need an amount column and a challan number, roll number "
+                             "or description column")
+        for line_number, row in enumerate(reader, start=2):
+            yield line_number, {field: (row.get(column) or "").strip() for field, column in mapping.items()}
+
+def parse_amount(value: str) -> Optional[int]:
+    """Parse '1,200.00' or 'Rs. 1200' as a whole rupee amount; None if it is not one"""
+    # Take the first number in the cell, so the dot of a "Rs." label is not
+    # read as a decimal point
+    found = AMOUNT_PATTERN.search(value)
+    if found is None:
+        return None
+    try:
+        amount = Decimal(found.group(0).replace(",", ""))
+    except InvalidOperation:
+        return None
+    if amount <= 0 or amount != amount.to_integral_value():
+        return None
+    return int(amount)
+
+def parse_reference(value: str) -> Tuple[Optional[str], bool]:
+    """Get the challan number from a statement reference, ignoring spaces and separators.
+
+    Returns (number, mistyped): the number is None when the reference has no
+    digits or fails the challan number check digit.
+    """
+    digits = re.sub(r"\D", "", value)
+    if not digits:
+        return None, False
+    if not is_valid_challan_number(digits):
+        return None, True
+    return digits, False
+
+def _entry(line: int, row: Dict) -> Dict:
+    roll = row.get('roll_number') or ""
+    if not roll:
+        found = ROLL_PATTERN.search(row.get('description', ""))
+        roll = found.group(0) if found else ""
+    reference_number, mistyped = parse_reference(row.get('reference', ""))
+    return {
+        'line': line,
+        'transaction_id': row.get('transaction_id', ""),
+        'date': row.get('date', ""),
+        'reference': row.get('reference', ""),
+        'reference_number': reference_number,
+        'mistyped': mistyped,
+        'roll_number': roll.upper(),
+        'amount': parse_amount(row.get('amount', "")),
+        'challan_id': None,
+        'challan_number': None,
+        'reason': "",
+    }
+
+_CHALLANS_BY_NUMBER = ("SELECT id, challan_number, roll_number, amount, status FROM student_challans "
+                       "WHERE challan_number IN (SELECT value FROM json_each(?))")
+_CHALLANS_BY_ROLL = ("SELECT id, challan_number, roll_number, amount, status FROM student_challans "
+                     "WHERE upper(roll_number) IN (SELECT value FROM json_each(?)) "
+                     "ORDER BY upper(roll_number), created_date, id")
+
+def _fetch_challans(conn, query: str, values) -> List[tuple]:
+    # json_each() passes a whole chunk as one parameter; each lookup uses the
+    # challan number or roll number index
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    values = sorted(values)
+    rows = []
+    for start in range(0, len(values), LOOKUP_CHUNK_SIZE):
+        rows.extend(cursor.execute(query, (json.dumps(values[start:start + LOOKUP_CHUNK_SIZE]),)).fetchall())
+    return rows
+
+def _load_candidates(conn, entries: List[Dict]) -> Tuple[Dict[str, tuple], Dict[tuple, List[tuple]]]:
+    """Fetch the challans the statement entries could refer to.
+
+    Returns the hash indexes the matcher probes: challan number -> (ID,
+    roll number, amount, status), and (roll number, amount) -> open (ID,
+    challan number) pairs, oldest first. Roll numbers are only looked up
+    for entries whose challan number is missing or unknown, as the others
+    never fall back on them.
+    """
+    references = {e['reference_number'] for e in entries} - {None}
+    by_number = {}
+    for challan_id, number, roll, amount, status in _fetch_challans(conn, _CHALLANS_BY_NUMBER, references):
+        by_number[number] = (challan_id, roll.upper(), amount, status)
+
+    roll_numbers = {e['roll_number'] for e in entries
+                    if e['roll_number'] and e['reference_number'] not in by_number}
+    by_roll_amount = defaultdict(list)
+    for challan_id, number, roll, amount, status in _fetch_challans(conn, _CHALLANS_BY_ROLL, roll_numbers):
+        if status in OPEN_STATUSES:
+            by_roll_amount[(roll.upper(), amount)].append((challan_id, number))
+    return by_number, by_roll_amount
+
+def match_entries(entries: List[Dict], by_number: Dict[str, tuple],
+                  by_roll_amount: Dict[tuple, List[tuple]]) -> Dict[str, List[Dict]]:
+    """Sort statement entries into matched, unmatched and ambiguous.
+
+    A challan number is trusted when the challan is open and the amount
+    (and roll number, if quoted) agree; otherwise the entry falls back to
+    a unique open challan of the same roll number and amount. Each challan
+    is matched at most once.
+    """
+    results = {'matched': [], 'unmatched': [], 'ambiguous': []}
+    claimed = {}
+
+    # Entries quoting a known challan number go first, so a roll number
+    # fallback can never take a challan that a later line names explicitly
+    for entry in sorted(entries, key=lambda e: e['reference_number'] not in by_number):
+        if entry['amount'] is None:
+            entry['reason'] = "not a positive whole amount"
+            results['unmatched'].append(entry)
+            continue
+
+        reference = entry['reference_number']
+        challan = by_number.get(reference) if reference is not None else None
+        roll, amount = entry['roll_number'], entry['amount']
+
+        if challan is not None:
+            challan_id, challan_roll, challan_amount, status = challan
+            entry['challan_id'], entry['challan_number'] = challan_id, reference
+            if challan_id in claimed:
+                entry['reason'] = f"challan already matched by line {claimed[challan_id]}"
+                results['ambiguous'].append(entry)
+            elif status not in OPEN_STATUSES:
+                entry['reason'] = f"challan is already {status}"
+                results['unmatched'].append(entry)
+            elif challan_amount != amount:
+                entry['reason'] = f"amount differs from the challan (Rs. {challan_amount})"
+                results['ambiguous'].append(entry)
+            elif roll and roll != challan_roll:
+                entry['reason'] = f"roll number differs from the challan ({challan_roll})"
+                results['ambiguous'].append(entry)
+            else:
+                claimed[challan_id] = entry['line']
+                results['matched'].append(entry)
+            continue
+
+        if entry['mistyped']:
+            unknown = "challan number fails its check digit"
+        elif reference is not None:
+            unknown = "unknown challan number"
+        else:
+            unknown = ""
+        candidates = [c for c in by_roll_amount.get((roll, amount), ()) if c[0] not in claimed] if roll else []
+        prefix = f"{unknown}; " if unknown else ""
+        if len(candidates) == 1:
+            entry['challan_id'], entry['challan_number'] = candidates[0]
+            entry['reason'] = f"{prefix}matched by roll number and amount"
+            claimed[candidates[0][0]] = entry['line']
+            results['matched'].append(entry)
+        elif candidates:
+            entry['reason'] = f"{prefix}{len(candidates)} open challans for this roll number and amount"
+            results['ambiguous'].append(entry)
+        elif roll:
+            entry['reason'] = f"{prefix}no open challan for this roll number and amount"
+            results['unmatched'].append(entry)
+        else:
+            entry['reason'] = unknown or "no challan or roll number"
+            results['unmatched'].append(entry)
+
+    for kind in results.values():
+        kind.sort(key=lambda e: e['line'])
+    return results
+
+@timed(rows=lambda report: report['total'])
+def reconcile_statement(source, apply: bool = True, comments: str = "Reconciled with bank statement") -> Dict:
+    """Match a bank statement CSV against challans and approve the matches.
+
+    Entries are streamed from the file, the challans they could refer to are
+    fetched with a few indexed queries, and matching runs on in-memory hash
+    indexes. With apply=True every matched challan is approved in the same
+    transaction as the lookup, so no challan can change in between. Returns
+    a report with the matched, unmatched and ambiguous entries.
+    """
+    report = {'total': 0, 'updated': 0, 'matched': [], 'unmatched': [], 'ambiguous': [], 'errors': []}
+    try:
+        entries = [_entry(line, row) for line, row in iter_statement_rows(source)]
+    except (ValueError, csv.Error, UnicodeDecodeError) as e:
+        report['errors'].append(str(e))
+        return report
+    report['total'] = len(entries)
+
+    try:
+        with connection() as conn:
+            if apply and not conn.in_transaction:
+                conn.execute("BEGIN IMMEDIATE")
+            by_number, by_roll_amount = _load_candidates(conn, entries)
+            report.update(match_entries(entries, by_number, by_roll_amount))
+
+            matched_ids = [e['challan_id'] for e in report['matched']]
+            if apply and matched_ids:
+                # Joins the transaction opened above
+                outcomes = bulk_update_challan_status(RECONCILED_STATUS, comments, challan_ids=matched_ids)
+                updated = [i for i, outcome in outcomes.items() if outcome == 'updated']
+                if len(updated) != len(matched_ids):
+                    raise RuntimeError("could not approve every matched challan")
+                report['updated'] = len(updated)
+    except Exception as e:
+        print(f"Error reconciling statement: {e}")
+        report['updated'] = 0
+        report['errors'].append(str(e))
+        return report
+
+    if report['updated']:
+        notify_status_change([e['challan_id'] for e in report['matched']], RECONCILED_STATUS, comments)
+    return report
+
+def entries_to_csv(entries: List[Dict]) -> str:
+    """Render report entries (matched, unmatched or ambiguous) as CSV"""
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=REPORT_FIELDS, extrasaction='ignore')
+    writer.writeheader()
+    writer.writerows(entries)
+    return output.getvalue()
+
+def write_reports(report: Dict, directory: str, prefix: str = "reconciliation") -> List[str]:
+    """Write matched.csv, unmatched.csv and ambiguous.csv reports; returns their paths"""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for kind in ('matched', 'unmatched', 'ambiguous'):
+        path = os.path.join(directory, f"{prefix}_{kind}.csv")
+        with open(path, "w", newline="") as f:
+            f.write(entries_to_csv(report[kind]))
+        paths.append(path)
+    return paths
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconcile a bank statement CSV against challans")
+    parser.add_argument("statement")
+    parser.add_argument("--reports", default="reports", help="directory for the matched/unmatched/ambiguous CSVs")
+    parser.add_argument("--dry-run", action="store_true", help="match and report without approving anything")
+    args = parser.parse_args()
+
+    from db import init_database
+
+    init_database()
+    report = reconcile_statement(args.statement, apply=not args.dry_run)
+    if report['errors']:
+        raise SystemExit(f"Reconciliation failed: {'; '.join(report['errors'])}")
+    prefix = os.path.splitext(os.path.basename(args.statement))[0]
+    for path in write_reports(report, args.reports, prefix):
+        print(path)
+    print(f"{report['total']:,} entries: {len(report['matched']):,} matched "
+          f"({report['updated']:,} approved), {len(report['unmatched']):,} unmatched, "
+          f"{len(report['ambiguous']):,} ambiguous")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional
+from pdf_store import get_cached_pdf, store_challan_pdf
+
+RENDER_WORKERS = int(os.environ.get("CHALLAN_RENDER_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Jobs allowed to wait or run at once; submissions beyond this are refused
+RENDER_MAX_PENDING = int(os.environ.get("CHALLAN_RENDER_MAX_PENDING", "64"))
+# Finished jobs whose bytes were never collected are dropped after this long
+RENDER_RESULT_TTL = 600.0
+
+class RenderQueueFull(Exception):
+    """Raised when the render queue is at capacity"""
+
+def _render(challan: Dict):
+    # Runs in a worker process, the only place reportlab needs loading
+    from pdf_generator import generate_challan_pdf
+
+    start = time.perf_counter()
+    data = generate_challan_pdf(challan)
+    return data, time.perf_counter() - start
+
+class RenderService:
+    """Render challan PDFs on a process pool so Streamlit script threads never block on reportlab"""
+
+    def __init__(self, workers: int = RENDER_WORKERS, max_pending: int = RENDER_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._jobs: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        # Recent (queue wait + render) and render-only latencies, in seconds
+        self._latencies = deque(maxlen=1000)
+        self._render_times = deque(maxlen=1000)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn keeps workers independent of the server's threads and open handles
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def submit(self, challan: Dict) -> str:
+        """Queue a challan for rendering and return its job ID.
+
+        Raises RenderQueueFull when max_pending jobs are already in flight.
+        """
+        job_id = uuid.uuid4().hex
+        job = {'status': 'queued', 'submitted': time.monotonic(), 'result': None, 'error': None}
+
+        cached = get_cached_pdf(challan) if challan.get('id') is not None else None
+        with self._lock:
+            self._expire()
+            if cached is not None:
+                job.update(status='done', result=cached, finished=time.monotonic())
+                self._jobs[job_id] = job
+                return job_id
+
+            if self._in_flight() >= self.max_pending:
+                self._rejected += 1
+                raise RenderQueueFull(f"{self.max_pending} renders already queued")
+
+            try:
+                job['future'] = self._get_executor().submit(_render, challan)
+            except BrokenProcessPool:
+                # A worker died (e.g. killed for memory); start a fresh pool
+                self._executor = None
+                job['future'] = self._get_executor().submit(_render, challan)
+            self._jobs[job_id] = job
+
+        job['future'].add_done_callback(lambda future: self._finish(job_id, challan, future))
+        return job_id
+
+    def _finish(self, job_id: str, challan: Dict, future):
+        try:
+            data, render_time = future.result()
+        except Exception as e:
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is not None:
+                    job.update(status='failed', error=str(e), finished=time.monotonic())
+                self._failed += 1
+            return
+
+        if challan.get('id') is not None:
+            store_challan_pdf(challan, data)
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(status='done', result=data, finished=time.monotonic())
+                self._latencies.append(job['finished'] - job['submitted'])
+            self._render_times.append(render_time)
+            self._completed += 1
+
+    def _in_flight(self) -> int:
+        return sum(1 for job in self._jobs.values() if job['status'] == 'queued')
+
+    def _expire(self):
+        cutoff = time.monotonic() - RENDER_RESULT_TTL
+        for job_id in [j for j, job in self._jobs.items() if job.get('finished', time.monotonic()) < cutoff]:
+            del self._jobs[job_id]
+
+    def status(self, job_id: str) -> str:
+        """Get a job's status: queued, running, done, failed or unknown"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return 'unknown'
+            if job['status'] == 'queued' and job['future'].running():
+                return 'running'
+            return job['status']
+
+    def result(self, job_id: str, timeout: Optional[float] = None) -> Optional[bytes]:
+        """Collect a finished job's PDF bytes, waiting up to timeout seconds.
+
+        Returns None if the job is unknown, failed or still rendering.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        if job['status'] == 'queued' and timeout:
+            try:
+                job['future'].result(timeout=timeout)
+            except Exception:
+                pass
+            # The done callback may still be storing the result
+            deadline = time.monotonic() + 1.0
+            while job['status'] == 'queued' and time.monotonic() < deadline:
+                time.sleep(0.005)
+        with self._lock:
+            if job['status'] != 'done':
+                return None
+            self._jobs.pop(job_id, None)
+            return job['result']
+
+    def metrics(self) -> Dict:
+        """Get queue depth, throughput counters and latency percentiles (ms)"""
+        with self._lock:
+            queued = [job for job in self._jobs.values() if job['status'] == 'queued']
+            running = sum(1 for job in queued if job['future'].running())
+            latencies = sorted(self._latencies)
+            render_times = sorted(self._render_times)
+            return {
+                'workers': self.workers,
+                'queue_depth': len(queued) - running,
+                'running': running,
+                'completed': self._completed,
+                'failed': self._failed,
+                'rejected': self._rejected,
+                'latency_p50_ms': _percentile(latencies, 50),
+                'latency_p95_ms': _percentile(latencies, 95),
+                'render_p50_ms': _percentile(render_times, 50),
+                'render_p95_ms': _percentile(render_times, 95),
+            }
+
+    def shutdown(self, wait: bool = True):
+        """Stop the worker processes"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=not wait)
+            self._executor = None
+
+def _percentile(sorted_values, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index] * 1000
+
+_service: Optional[RenderService] = None
+_service_lock = threading.Lock()
+
+def get_render_service() -> RenderService:
+    """Get the process-wide render service"""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = RenderService()
+    return _service
@@ -1,11 +1,14 @@
 import streamlit as st
-import pandas as pd
 from datetime import datetime, timedelta
-import os
-from db import insert_challan, get_student_challans, update_receipt_upload
-from pdf_generator import generate_challan_pdf
+from db import insert_challan, get_challan, get_student_challans, update_receipt_upload
+from pdf_store import get_challan_pdf
+from render_service import get_render_service, RenderQueueFull
+from receipts import store_receipt, get_preview, ReceiptRejected, RECEIPT_EXTENSIONS, RECEIPT_MAX_BYTES
 from auth import logout, get_current_user
-import uuid
+from presentation import challan_frame, STATUS_LABELS
+
+# Seconds between checks on a background PDF render
+RENDER_POLL_INTERVAL = 0.5
 
 def student_view():
     """Student interface"""
@@ -78,17 +81,34 @@ def new_challan_form():
                 challan_id = insert_challan(challan_data)
                 if challan_id:
                     st.success("✅ Challan created successfully!")
-                    # Generate PDF and store in session state
-                    st.session_state.challan_pdf_buffer = generate_challan_pdf(challan_data)
+                    # Render the PDF in the background; the download button
+                    # appears once the job finishes
+                    challan_data = get_challan(challan_id) or dict(challan_data, id=challan_id)
+                    st.session_state.challan_pdf_buffer = None
                     st.session_state.challan_download_info = {
                         'roll_number': roll_number,
-                        'challan_id': challan_id
+                        'challan_id': challan_id,
+                        'challan': challan_data
                     }
+                    submit_pdf_render(challan_data)
                 else:
                     st.error("❌ Error creating challan. Please try again.")
             else:
                 st.error("❌ Please fill all required fields.")
 
+    # Pick up the PDF from the render service; only the progress fragment
+    # reruns while the job is in progress
+    if st.session_state.get('challan_render_job'):
+        render_progress()
+    if st.session_state.pop('challan_render_failed', False):
+        st.error("❌ Could not generate the challan PDF.")
+    
+    info = st.session_state.challan_download_info
+    if info and not st.session_state.challan_pdf_buffer and not st.session_state.get('challan_render_job'):
+        if st.button("🔄 Generate Challan PDF"):
+            submit_pdf_render(info['challan'])
+            st.rerun()
+
     # Always show the download button if PDF is ready (outside the form, not conditional on button click)
     if st.session_state.challan_pdf_buffer and st.session_state.challan_download_info:
         info = st.session_state.challan_download_info
@@ -104,6 +124,33 @@ def new_challan_form():
         # st.session_state.challan_pdf_buffer = None
         # st.session_state.challan_download_info = None
 
+@st.fragment(run_every=RENDER_POLL_INTERVAL)
+def render_progress():
+    """Poll the background PDF render without rerunning the rest of the page"""
+    job_id = st.session_state.get('challan_render_job')
+    if not job_id:
+        return
+    service = get_render_service()
+    status = service.status(job_id)
+    if status in ('queued', 'running'):
+        st.info("⏳ Preparing your challan PDF...")
+        return
+    if status == 'done':
+        st.session_state.challan_pdf_buffer = service.result(job_id)
+    else:
+        st.session_state.challan_render_failed = True
+    st.session_state.challan_render_job = None
+    # One full rerun to show the download button (and stop this poller)
+    st.rerun()
+
+def submit_pdf_render(challan: dict):
+    """Queue a challan PDF render and remember the job in the session"""
+    try:
+        st.session_state.challan_render_job = get_render_service().submit(challan)
+    except RenderQueueFull:
+        st.session_state.challan_render_job = None
+        st.warning("⚠️ The server is busy generating challans. Please try again in a moment.")
+
 def view_my_challans():
     """View student's challans"""
     st.markdown("#### My Challans")
@@ -111,27 +158,14 @@ def view_my_challans():
     challans = get_student_challans(get_current_user())
     
     if challans:
-        df = pd.DataFrame(challans)
-        
-        # Format the dataframe
-        df['created_date'] = pd.to_datetime(df['created_date']).dt.strftime('%Y-%m-%d %H:%M')
-        df['amount'] = df['amount'].apply(lambda x: f"Rs. {x:,}")
-        
-        # Status styling
-        def style_status(status):
-            colors = {
-                'pending': '🟡 Pending',
-                'paid': '🟢 Paid',
-                'approved': '✅ Approved',
-                'rejected': '❌ Rejected'
-            }
-            return colors.get(status, status)
-        
-        df['status'] = df['status'].apply(style_status)
+        df = challan_frame(
+            challans, ['id', 'challan_number', 'student_name', 'semester', 'amount', 'reason', 'created_date', 'status'],
+            status_labels=STATUS_LABELS
+        )
         
         # Display table
         st.dataframe(
-            df[['id', 'student_name', 'semester', 'amount', 'reason', 'created_date', 'status']],
+            df,
             use_container_width=True,
             hide_index=True
         )
@@ -145,7 +179,7 @@ def view_my_challans():
             if st.button("📥 Re-download PDF"):
                 challan = next((c for c in challans if c['id'] == selected_id), None)
                 if challan:
-                    pdf_buffer = generate_challan_pdf(challan)
+                    pdf_buffer = get_challan_pdf(challan)
                     st.download_button(
                         label="Download PDF",
                         data=pdf_buffer,
@@ -176,25 +210,28 @@ def upload_receipt():
         # File upload
         uploaded_file = st.file_uploader(
             "Choose receipt file",
-            type=['pdf', 'jpg', 'jpeg', 'png'],
-            help="Upload a clear image or PDF of your payment receipt"
+            type=list(RECEIPT_EXTENSIONS),
+            help=f"Upload a clear image or PDF of your payment receipt "
+                 f"(max {round(RECEIPT_MAX_BYTES / (1024 * 1024), 1):g} MB)"
         )
         
         if uploaded_file and st.button("Upload Receipt"):
-            # Create uploads directory if not exists
-            os.makedirs("uploads/receipts", exist_ok=True)
-            
-            # Generate unique filename
-            file_extension = uploaded_file.name.split('.')[-1]
-            filename = f"receipt_{challan_id}_{uuid.uuid4().hex[:8]}.{file_extension}"
-            filepath = os.path.join("uploads/receipts", filename)
+            try:
+                # Streams the upload to disk in chunks, deduplicated by content
+                filepath, receipt_hash = store_receipt(uploaded_file, uploaded_file.name)
+            except ReceiptRejected as e:
+                st.error(f"❌ {e}")
+                return
+            except OSError as e:
+                print(f"Error saving receipt: {e}")
+                st.error("❌ Error uploading receipt. Please try again.")
+                return
             
-            # Save file
-            with open(filepath, "wb") as f:
-                f.write(uploaded_file.getbuffer())
+            # Start the admin review images in the background
+            get_preview(filepath, receipt_hash)
             
             # Update database
-            if update_receipt_upload(challan_id, filepath):
+            if update_receipt_upload(challan_id, filepath, receipt_hash):
                 st.success("✅ Receipt uploaded successfully! Admin will review it soon.")
             else:
                 st.error("❌ Error uploading receipt. Please try again.")
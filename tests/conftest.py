@@ -0,0 +1,37 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import pdf_store
+import query_cache
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """A freshly migrated database in tmp_path, with an empty query cache"""
+    monkeypatch.setattr(pdf_store, "PDF_DIR", str(tmp_path / "pdfs"))
+    db.configure_database(str(tmp_path / "challans.db"))
+    db.init_database()
+    query_cache.clear_cache()
+    yield db
+    db.close_pool()
+    query_cache.clear_cache()
+
+def make_challan(**fields) -> dict:
+    """A valid challan record, with any field overridden"""
+    challan = {
+        'student_name': "Test Student",
+        'roll_number': "2021-CS-001",
+        'id_card_number': "12345-1234567-1",
+        'semester': "1st Semester",
+        'amount': 500,
+        'reason': "Late fee",
+        'created_date': "2026-01-15 10:00:00",
+        'valid_till': "2026-01-18",
+        'status': 'pending',
+    }
+    challan.update(fields)
+    return challan
@@ -0,0 +1,42 @@
+import pytest
+
+from conftest import make_challan
+
+def test_outcome_per_challan_id(database):
+    pending = database.insert_challan(make_challan())
+    approved = database.insert_challan(make_challan(status='approved'))
+
+    outcomes = database.bulk_update_challan_status('approved', "ok", challan_ids=[pending, approved, 999, pending])
+
+    assert outcomes == {pending: 'updated', approved: 'unchanged', 999: 'not_found'}
+    challan = database.get_challan(pending)
+    assert (challan['status'], challan['admin_comments']) == ('approved', "ok")
+
+def test_filters_update_every_matching_challan(database):
+    first = database.insert_challan(make_challan(semester="2nd Semester"))
+    second = database.insert_challan(make_challan(semester="2nd Semester", status='rejected'))
+    other = database.insert_challan(make_challan(semester="3rd Semester"))
+
+    outcomes = database.bulk_update_challan_status('rejected', filters={'semester': "2nd Semester"})
+
+    assert outcomes == {first: 'updated', second: 'unchanged'}
+    assert database.get_challan(other)['status'] == 'pending'
+    assert database.verify_challan_stats() == {}
+
+def test_failed_transaction_changes_nothing(database):
+    ids = [database.insert_challan(make_challan()) for _ in range(3)]
+    with database.connection() as conn:
+        conn.execute(f"""
+            CREATE TRIGGER fail_update BEFORE UPDATE ON student_challans WHEN new.id = {ids[1]}
+            BEGIN SELECT RAISE(ABORT, 'refused'); END
+        """)
+
+    assert database.bulk_update_challan_status('approved', challan_ids=ids) == {i: 'error' for i in ids}
+    assert [database.get_challan(i)['status'] for i in ids] == ['pending'] * 3
+    # Without IDs to report against, a failure is raised instead
+    with pytest.raises(Exception, match="refused"):
+        database.bulk_update_challan_status('approved', filters={})
+
+def test_needs_ids_or_filters(database):
+    with pytest.raises(ValueError):
+        database.bulk_update_challan_status('approved')
@@ -0,0 +1,56 @@
+from datetime import datetime
+
+from conftest import make_challan
+
+def test_check_digit_and_format(database):
+    assert database.luhn_check_digit("7992739871") == 3
+    assert database.format_challan_number(12345, 2025) == "2500123456"
+    # IDs wider than the padding just make the number longer
+    assert database.format_challan_number(123456789, 2025) == "25123456789" + str(
+        database.luhn_check_digit("25123456789"))
+
+def test_check_digit_catches_single_digit_and_transposition_errors(database):
+    number = database.format_challan_number(4827, 2026)
+    assert database.is_valid_challan_number(number)
+    for position in range(len(number)):
+        for digit in "0123456789":
+            if digit != number[position]:
+                assert not database.is_valid_challan_number(number[:position] + digit + number[position + 1:])
+    # Adjacent transpositions too, except 09 <-> 90
+    for position in range(len(number) - 1):
+        a, b = number[position], number[position + 1]
+        if a != b and {a, b} != {"0", "9"}:
+            swapped = number[:position] + b + a + number[position + 2:]
+            assert not database.is_valid_challan_number(swapped)
+    assert not database.is_valid_challan_number(number[:-3])
+    assert not database.is_valid_challan_number("26ABCDEFGH")
+
+def test_inserts_allocate_consecutive_unique_numbers(database):
+    year = datetime.now().year
+    first = database.insert_challan(make_challan())
+    database.insert_challans([make_challan() for _ in range(3)])
+    last = database.insert_challan(make_challan())
+
+    challans = database.get_all_challans.uncached()
+    assert sorted(c['id'] for c in challans) == list(range(first, last + 1))
+    assert {c['challan_number'] for c in challans} == {
+        database.format_challan_number(i, year) for i in range(first, last + 1)}
+
+def test_deleted_ids_are_not_reused(database):
+    database.insert_challan(make_challan())
+    last = database.insert_challan(make_challan())
+    with database.connection() as conn:
+        conn.execute("DELETE FROM student_challans WHERE id = ?", (last,))
+
+    assert database.insert_challan(make_challan()) == last + 1
+    assert database.insert_challans([make_challan()]) == 1
+    assert database.get_challan(last + 2) is not None
+
+def test_lookup_by_number(database):
+    challan_id = database.insert_challan(make_challan())
+    number = database.get_challan(challan_id)['challan_number']
+
+    spaced = f"{number[:2]} {number[2:-1]}-{number[-1]}"
+    assert database.get_challan_by_number(spaced)['id'] == challan_id
+    # A number failing its check digit is rejected without a lookup
+    assert database.get_challan_by_number(number[:-1] + str((int(number[-1]) + 1) % 10)) is None
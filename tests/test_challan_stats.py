@@ -0,0 +1,25 @@
+from conftest import make_challan
+
+def test_counters_follow_inserts_updates_and_deletes(database):
+    """The trigger-maintained counters agree with a full recount after every kind of write"""
+    ids = [database.insert_challan(make_challan(amount=100 * n)) for n in range(1, 4)]
+    database.insert_challans([make_challan(amount=50, status='paid') for _ in range(5)])
+    database.update_challan_status(ids[0], 'approved')
+    database.bulk_update_challan_status('rejected', challan_ids=ids[1:])
+    with database.connection() as conn:
+        conn.execute("DELETE FROM student_challans WHERE id = ?", (ids[2],))
+        conn.execute("UPDATE student_challans SET amount = 700 WHERE id = ?", (ids[1],))
+
+    assert database.verify_challan_stats() == {}
+    assert database.get_challan_stats() == {
+        'total': 7, 'pending': 0, 'paid': 5, 'approved': 1, 'rejected': 1, 'total_amount': 100 + 700 + 250,
+    }
+
+def test_verify_reports_drift_and_rebuild_repairs_it(database):
+    database.insert_challan(make_challan())
+    with database.connection() as conn:
+        conn.execute("UPDATE challan_stats SET count = count + 3 WHERE status = 'pending'")
+
+    assert database.verify_challan_stats() == {'pending': ((4, 500), (1, 500))}
+    database.rebuild_challan_stats()
+    assert database.verify_challan_stats() == {}
@@ -0,0 +1,13 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_check_plans_passes_on_migrated_database(tmp_path):
+    """`python db.py check-plans` exits non-zero if a hot query scans the table or sorts"""
+    env = dict(os.environ, CHALLAN_DB_PATH=str(tmp_path / "challans.db"), CHALLAN_METRICS="0")
+    result = subprocess.run([sys.executable, "db.py", "check-plans"], cwd=ROOT, env=env,
+                            capture_output=True, text=True)
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert "NOT INDEXED" not in result.stdout
@@ -0,0 +1,74 @@
+import io
+
+import db
+import reconcile
+from conftest import make_challan
+
+def entry(line: int, reference: str = "", roll: str = "", amount: str = "500") -> dict:
+    return reconcile._entry(line, {'reference': reference, 'roll_number': roll, 'amount': amount})
+
+def statement(*rows) -> io.BytesIO:
+    lines = ["reference,roll_number,amount"] + [",".join(row) for row in rows]
+    return io.BytesIO("\n".join(lines).encode())
+
+def reasons(results: dict) -> dict:
+    return {kind: [(e['line'], e['challan_id'], e['reason']) for e in entries] for kind, entries in results.items()}
+
+def test_roll_numbers_match_case_insensitively(database):
+    challan_id = database.insert_challan(make_challan(roll_number="2021-cs-001"))
+
+    report = reconcile.reconcile_statement(statement(("", "2021-CS-001", "500")))
+
+    assert [e['challan_id'] for e in report['matched']] == [challan_id]
+    assert report['updated'] == 1
+    assert database.get_challan(challan_id)['status'] == 'approved'
+
+def test_mistyped_number_falls_back_to_roll_and_amount():
+    number = db.format_challan_number(1, 2026)
+    # Last digit before the check digit mistyped
+    mistyped = number[:-2] + "2" + number[-1]
+    by_roll_amount = {("2021-CS-001", 500): [(1, number)]}
+
+    results = reconcile.match_entries([entry(1, mistyped, "2021-cs-001")], {}, by_roll_amount)
+
+    assert reasons(results)['matched'] == [
+        (1, 1, "challan number fails its check digit; matched by roll number and amount")]
+
+def test_duplicate_lines_match_a_challan_once():
+    number = "2600000018"
+    by_number = {number: (1, "2021-CS-001", 500, 'pending')}
+
+    results = reconcile.match_entries([entry(1, number), entry(2, number)], by_number, {})
+
+    assert reasons(results) == {
+        'matched': [(1, 1, "")],
+        'unmatched': [],
+        'ambiguous': [(2, 1, "challan already matched by line 1")],
+    }
+
+def test_named_challan_is_not_taken_by_a_roll_fallback():
+    number = "2600000018"
+    by_number = {number: (1, "2021-CS-001", 500, 'pending')}
+    by_roll_amount = {("2021-CS-001", 500): [(1, number)]}
+
+    # The roll-only line comes first in the file but must not claim challan 1
+    results = reconcile.match_entries([entry(1, roll="2021-CS-001"), entry(2, number)], by_number, by_roll_amount)
+
+    assert reasons(results)['matched'] == [(2, 1, "")]
+    assert reasons(results)['unmatched'] == [(1, None, "no open challan for this roll number and amount")]
+
+def test_bad_amounts_are_unmatched():
+    for value in ("", "abc", "0", "-500", "500.50"):
+        assert reconcile.parse_amount(value) is None
+    assert reconcile.parse_amount("Rs. 1,200.00") == 1200
+
+    results = reconcile.match_entries([entry(1, roll="2021-CS-001", amount="12.5")], {}, {})
+
+    assert reasons(results)['unmatched'] == [(1, None, "not a positive whole amount")]
+
+def test_several_open_challans_are_ambiguous():
+    by_roll_amount = {("2021-CS-001", 500): [(1, "2600000018"), (2, "2600000026")]}
+
+    results = reconcile.match_entries([entry(1, roll="2021-CS-001")], {}, by_roll_amount)
+
+    assert reasons(results)['ambiguous'] == [(1, None, "2 open challans for this roll number and amount")]
@@ -3,10 +3,8 @@ import bcrypt
 import uuid
 import csv
 import io
+import warnings
 from typing import List, Dict
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 
 def hash_password(password: str) -> str:
     """Hash password using bcrypt"""
@@ -41,41 +39,22 @@ def export_to_csv(data: List[Dict]) -> str:
     
     return output.getvalue()
 
-def send_email_notification(to_email: str, subject: str, body: str, smtp_config: Dict = None):
-    """Send email notification (optional feature)"""
-    if not smtp_config:
-        # Default SMTP configuration (for demonstration)
-        smtp_config = {
-            'smtp_server': 'smtp.gmail.com',
-            'smtp_port': 587,
-            'email': 'your-email@gmail.com',
-            'password': 'your-app-password'
-        }
-    
-    try:
-        # Create message
-        msg = MIMEMultipart()
-        msg['From'] = smtp_config['email']
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        
-        # Add body
-        msg.attach(MIMEText(body, 'plain'))
-        
-        # Create SMTP session
-        server = smtplib.SMTP(smtp_config['smtp_server'], smtp_config['smtp_port'])
-        server.starttls()  # Enable TLS
-        server.login(smtp_config['email'], smtp_config['password'])
-        
-        # Send email
-        text = msg.as_string()
-        server.sendmail(smtp_config['email'], to_email, text)
-        server.quit()
-        
-        return True
-    except Exception as e:
-        print(f"Error sending email: {e}")
-        return False
+def send_email_notification(to_email: str, subject: str, body: str, smtp_config: Dict = None) -> bool:
+    """Queue an email notification in the outbox (optional feature).
+
+    The mail is not sent here: the background dispatcher delivers it using
+    the CHALLAN_SMTP_* settings. smtp_config is deprecated and ignored.
+    """
+    if smtp_config is not None:
+        warnings.warn("send_email_notification() ignores smtp_config; set the CHALLAN_SMTP_* "
+                      "environment variables instead", DeprecationWarning, stacklevel=2)
+    from notifications import queue_email
+    return queue_email(to_email, subject, body)
+
+SEMESTERS = ["1st Semester", "2nd Semester", "3rd Semester", "4th Semester",
+             "5th Semester", "6th Semester", "7th Semester", "8th Semester"]
+
+CHALLAN_STATUSES = ["pending", "paid", "approved", "rejected"]
 
 def validate_cnic(cnic: str) -> bool:
     """Validate CNIC format"""
@@ -88,6 +67,18 @@ def validate_cnic(cnic: str) -> bool:
     
     return True
 
+def validate_amount(amount) -> bool:
+    """Validate fine amount (positive whole rupees)"""
+    try:
+        value = float(amount)
+    except (TypeError, ValueError):
+        return False
+    return value > 0 and value == int(value)
+
+def validate_semester(semester: str) -> bool:
+    """Validate semester name"""
+    return semester in SEMESTERS
+
 def validate_file_type(filename: str, allowed_types: List[str]) -> bool:
     """Validate file type"""
     if not filename: